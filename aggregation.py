@@ -0,0 +1,45 @@
+import numpy as np
+
+from energy_series import LOCAL_OFFSET_HOURS, EnergySeries
+
+GRANULARITIES = ["hour", "day", "week", "month"]
+
+# Span maksimum (hari) untuk tiap granularity saat mode otomatis
+AUTO_MAX_DAYS = {"hour": 3, "day": 62, "week": 366}
+
+
+def select_granularity(start_datetime, end_datetime, override=None):
+    """Pilih ukuran bucket dari panjang range tanggal, kecuali user memilih sendiri"""
+    if override in GRANULARITIES:
+        return override
+
+    span_days = (end_datetime.date() - start_datetime.date()).days + 1
+    for granularity, max_days in AUTO_MAX_DAYS.items():
+        if span_days <= max_days:
+            return granularity
+    return "month"
+
+
+def _sum_buckets(series, bucket_hours):
+    """Jumlah nilai per bucket; bucket_hours = jam awal bucket tiap baris (urut naik)"""
+    starts = np.flatnonzero(np.r_[True, bucket_hours[1:] != bucket_hours[:-1]])
+    sums = np.add.reduceat(series.values, starts, axis=0, dtype=np.float64)
+    return EnergySeries(bucket_hours[starts], sums, series.columns)
+
+
+def build_rollups(hourly):
+    """Hitung semua level (hour/day/week/month) dari EnergySeries hourly sekaligus"""
+    if hourly.empty:
+        return dict.fromkeys(GRANULARITIES, hourly)
+
+    # Nilai hourly diberi label akhir jam (hasil diff), geser ke awal jam sebelum dijumlah
+    days = (hourly.hours - 1 + LOCAL_OFFSET_HOURS) // 24
+    # 1970-01-01 hari Kamis, minggu dimulai hari Senin
+    weeks = (days + 3) // 7 * 7 - 3
+    months = days.astype("M8[D]").astype("M8[M]").astype("M8[D]").astype(np.int64)
+    return {
+        "hour": hourly,
+        "day": _sum_buckets(hourly, days * 24 - LOCAL_OFFSET_HOURS),
+        "week": _sum_buckets(hourly, weeks * 24 - LOCAL_OFFSET_HOURS),
+        "month": _sum_buckets(hourly, months * 24 - LOCAL_OFFSET_HOURS),
+    }
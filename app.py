@@ -1,16 +1,194 @@
 import streamlit as st
 from home_assistant_api import HomeAssistantAPI
 from ui import DashboardUI, PlotPV
+from fetcher import DEADLINE, fetch_all
+from planner import PANELS, plan_series, fetch_requests, load_balance, load_balances, site_series
+from fleet import FleetView
+from history_store import HistoryStore
+from day_cache import DayCache, TODAY_TTL
+from aggregation import GRANULARITIES, select_granularity
+from energy_series import LOCAL_TZ
+from site_registry import SiteRegistry
+from refresher import BackgroundRefresh, TodayRefresher, REFRESH_INTERVAL, REFRESH_JITTER
+from state_stream import StateStream, BUFFER_SIZE
+from sensor_snapshot import EntityFilter, SensorPoller, SENSOR_DOMAINS
+from metrics import metrics
 import datetime
 
+def render_pv_production(site_frame, granularity, key, site=None):
+    """Panel produksi PV"""
+    PlotPV.render_solar_production(site_frame["solar"].to_frame("value"), granularity, key=key, site=site)
+
+def render_energy_usage(site_frame, granularity, key, site=None):
+    """Panel penggunaan energi (consumed solar, PLN, baterai) langsung dari kolom energy balance"""
+    def column(name):
+        return site_frame[name].to_frame("value") if name in site_frame.columns else None
+
+    PlotPV.render_energy_usage(
+        column("consumed_solar"),
+        column("grid_import"),
+        column("grid_export"),
+        column("battery_discharge"),
+        column("battery_charge"),
+        granularity,
+        key=key,
+        site=site,
+    )
+
+PANEL_RENDERERS = {
+    "pv_production": render_pv_production,
+    "energy_usage": render_energy_usage,
+}
+
+# Jumlah kolom site per baris
+COLUMNS_PER_ROW = 4
+# Interval (detik) refresh kolom site saat mode live aktif
+LIVE_INTERVAL = 30
+# Pilihan granularity per site; "page" = ikut pilihan di atas halaman
+SITE_VIEWS = ["page"] + GRANULARITIES
+
+@st.cache_resource
+def get_site_registry():
+    """Daftar site dari sites.toml, dibaca sekali per proses"""
+    return SiteRegistry.load()
+
+@st.cache_resource
+def get_ha_api(instance):
+    """Satu HomeAssistantAPI (beserta session HTTP-nya) per instance, dibuat saat pertama dibutuhkan"""
+    site = get_site_registry().get(instance)
+    return HomeAssistantAPI(instance, site.secrets_key)
+
+@st.cache_resource
+def get_history_store():
+    """Store histori lokal, satu untuk seluruh proses Streamlit"""
+    return HistoryStore()
+
+@st.cache_resource
+def get_day_cache():
+    """Cache harian (raw + hourly) yang dipakai bersama oleh semua rerun dan session"""
+    cache_config = st.secrets.get("cache", {})
+    return DayCache(today_ttl=float(cache_config.get("today_ttl", TODAY_TTL)))
+
+@st.cache_resource
+def get_refresher():
+    """Refresher background data hari ini (kalau diaktifkan di sites.toml), satu per proses"""
+    registry = get_site_registry()
+    settings = registry.refresher
+    if not settings.get("enabled"):
+        return None
+
+    sites = [registry.get(name) for name in registry.names()]
+    ha_apis = {site.name: get_ha_api(site.name) for site in sites}
+    return TodayRefresher(
+        sites,
+        ha_apis,
+        get_day_cache(),
+        interval=float(settings.get("interval", REFRESH_INTERVAL)),
+        jitter=float(settings.get("jitter", REFRESH_JITTER)),
+    ).start()
+
+@st.cache_resource
+def get_background_refresh():
+    """Refresh background untuk site yang sedang basi, satu per proses"""
+    return BackgroundRefresh(get_day_cache())
+
+@st.cache_resource
+def get_sensor_poller(instance):
+    """Poller /api/states satu site beserta snapshot terakhirnya, satu per proses"""
+    settings = get_site_registry().sensors
+    entity_filter = EntityFilter(settings.get("domains", SENSOR_DOMAINS), settings.get("patterns", ()))
+    return SensorPoller(get_ha_api(instance), entity_filter)
+
+@st.cache_resource
+def get_state_streams():
+    """Stream websocket per site (kalau diaktifkan di sites.toml), satu per proses"""
+    registry = get_site_registry()
+    settings = registry.stream
+    if not settings.get("enabled"):
+        return {}
+
+    buffer_size = int(settings.get("buffer_size", BUFFER_SIZE))
+    return {
+        name: StateStream(registry.get(name), get_ha_api(name), buffer_size=buffer_size).start()
+        for name in registry.names()
+    }
+
+def get_site_deadline(instance):
+    """Batas waktu tunggu (detik) fetch satu site per render: override per site atau [fetch] deadline"""
+    registry = get_site_registry()
+    return registry.get(instance).deadline or float(registry.fetch.get("deadline", DEADLINE))
+
+def render_site(instance, role_series, site_frame, granularity, live, stale=False):
+    """Satu kolom site; dijalankan sebagai fragment sehingga bisa rerun sendiri tanpa seluruh halaman.
+
+    Mode live: tiap rerun hanya mengambil state setelah titik terakhir di cache hari ini
+    (dari buffer stream websocket, atau polling histori kalau stream tidak tersedia),
+    lalu energy balance site dihitung ulang dari DayCache.
+    Polling histori jalan di background dan ditunggu paling lama selama deadline site; lewat dari itu
+    (atau gagal) site dianggap basi. Site basi (lewat deadline / offline) memakai data cache terakhir
+    dan hanya di-refresh di background.
+    """
+    day_cache = get_day_cache()
+    if live:
+        stream = get_state_streams().get(instance)
+        if stale or stream is None or not stream.merge_into(day_cache):
+            refresh = get_background_refresh().submit(get_site_registry().get(instance), get_ha_api(instance))
+            if not stale:
+                try:
+                    refresh.result(timeout=get_site_deadline(instance))
+                except Exception:
+                    # Refresh tetap jalan di background dan mengisi cache untuk rerun berikutnya
+                    stale = True
+
+    if stale:
+        DashboardUI.render_stale_badge(instance, offline=not get_ha_api(instance).breaker.healthy)
+
+    view = st.selectbox(
+        "View",
+        options=SITE_VIEWS,
+        format_func=lambda option: "Ikut halaman" if option == "page" else option,
+        key=f"{instance}_view",
+    )
+    site_granularity = granularity if view == "page" else view
+
+    if role_series and (live or site_granularity != granularity):
+        balance = load_balance(day_cache, instance, role_series, site_granularity, stale_ok=stale)
+        site_frame = balance.to_frame() if balance is not None else None
+
+    for panel in PANELS:
+        st.markdown(panel.title.format(instance=instance))
+        if site_frame is None or any(column not in site_frame.columns for column in panel.required):
+            continue
+        PANEL_RENDERERS[panel.key](site_frame, site_granularity, key=f"{instance}_{panel.key}", site=instance)
+
+    if get_site_registry().sensors.get("enabled"):
+        st.markdown(f"### 📟 {instance} Sensors")
+        poller = get_sensor_poller(instance)
+        # Site basi tidak di-poll, cukup snapshot terakhir; site lain ditunggu paling lama selama deadline-nya
+        snapshot = poller.snapshot if stale else poller.refresh(get_site_deadline(instance))
+        DashboardUI.render_sensors(snapshot, key=f"{instance}_sensors", site=instance)
+
 def main():
     ui = DashboardUI()
+
+    # Instrumentasi opsional lewat [metrics] di secrets: structured log (JSON per baris ke `log_file`
+    # atau stderr) dan file Prometheus
+    metrics_config = st.secrets.get("metrics", {})
+    if metrics_config.get("log_events", False):
+        metrics.enable_logging(metrics_config.get("log_file"))
+    else:
+        metrics.log_events = False
     
-    instances = ["Eddie02", "Mawar7", "HajiNawi", "Mawar8"]
-    ha_apis = {instance: HomeAssistantAPI(instance) for instance in instances}
+    # Hanya site yang sedang ditampilkan yang dibuatkan client API-nya
+    registry = get_site_registry()
+    get_refresher()
+    get_state_streams()
+    instances = ui.render_sidebar(registry)
+    live_mode = ui.render_live_toggle()
+    ha_apis = {instance: get_ha_api(instance) for instance in instances}
 
     # Date input for start and end date
-    col_start, col_end = st.columns(2)
+    col_start, col_end, col_granularity = st.columns(3)
     with col_start:
         start_date = st.date_input(
             "Start date",
@@ -25,96 +203,63 @@ def main():
             format="DD/MM/YYYY",
             key="end_date_picker"
         )
+    with col_granularity:
+        granularity_choice = st.selectbox(
+            "Granularity",
+            options=["auto"] + GRANULARITIES,
+            key="granularity_picker"
+        )
 
     # Set time to 00:00 and 23:59
     start_time = datetime.time(0, 0)
     end_time = datetime.time(23, 59)
 
-    # Combine date and time and convert to UTC
-    local_tz = datetime.timezone(datetime.timedelta(hours=7))  # WIB = UTC+7
+    # Combine date and time (WIB)
 
     # Start datetime
     local_start = datetime.datetime.combine(start_date, start_time)
-    start_datetime = local_start.replace(tzinfo=local_tz)
+    start_datetime = local_start.replace(tzinfo=LOCAL_TZ)
 
     # End datetime
     local_end = datetime.datetime.combine(end_date, end_time)
-    end_datetime = local_end.replace(tzinfo=local_tz)
-
-    # Iterate over each instance and fetch data
-    col1, col2, col3, col4 = st.columns(4)
-
-    for instance, col in zip(instances, [col1, col2, col3, col4]):
-        with col:
-            st.markdown(f"### 🔆 {instance} PV Production")
-            import_plts_entity = "sensor.pv_energy_total" if instance == "Eddie02" else "sensor.import_energy_plts"
-            solar_data = ha_apis[instance].get_pv_statistics(start_datetime, end_datetime, import_plts_entity)
-            if solar_data:
-                df_solar = PlotPV.process_pv_data(solar_data, start_datetime, end_datetime)
-                if df_solar is not None:
-                    PlotPV.render_solar_production(df_solar)
-
-            st.markdown(f"### ⚡ {instance} Energy Usage")
-            if instance == "Eddie02":
-                import_plts_entity = "sensor.pv_energy_total"
-                import_pln_entity = "sensor.victron_grid_energy_forward_total_32"
-                export_pln_entity = "sensor.victron_grid_energy_reverse_total_32"
-                energy_from_battery_entity = "sensor.energy_from_battery"
-                energy_to_battery_entity = "sensor.energy_to_battery"
-            else:
-                import_plts_entity = "sensor.import_energy_plts"
-                import_pln_entity = "sensor.import_energy_pln"
-                export_pln_entity = "sensor.export_energy_pln"
-                energy_from_battery_entity = None
-                energy_to_battery_entity = None
-
-            import_plts_data = ha_apis[instance].get_pv_statistics(start_datetime, end_datetime, import_plts_entity)
-            import_pln_data = ha_apis[instance].get_pv_statistics(start_datetime, end_datetime, import_pln_entity)
-            export_pln_data = ha_apis[instance].get_pv_statistics(start_datetime, end_datetime, export_pln_entity)
-
-            if energy_from_battery_entity and energy_to_battery_entity:
-                energy_from_battery_data = ha_apis[instance].get_pv_statistics(start_datetime, end_datetime, energy_from_battery_entity)
-                energy_to_battery_data = ha_apis[instance].get_pv_statistics(start_datetime, end_datetime, energy_to_battery_entity)
-            else:
-                energy_from_battery_data = None
-                energy_to_battery_data = None
-
-            if import_plts_data and import_pln_data:
-                df_import_plts = PlotPV.process_pv_data(import_plts_data, start_datetime, end_datetime)
-                df_import_pln = PlotPV.process_pv_data(import_pln_data, start_datetime, end_datetime)
-                
-                # Initialize df_export_pln as None
-                df_export_pln = None
-                df_consumed_solar = None
-
-                # Process export PLN data if available
-                if export_pln_data:
-                    df_export_pln = PlotPV.process_pv_data(export_pln_data, start_datetime, end_datetime)
-
-                # Calculate consumed solar - always create it if we have import_plts data
-                if df_import_plts is not None:
-                    df_consumed_solar = df_import_plts.copy()
-                    if df_export_pln is not None and not df_export_pln.empty:
-                        # Subtract export only if we have valid export data
-                        df_consumed_solar["value"] = df_import_plts["value"] - df_export_pln["value"]
-                    # else use import_plts as consumed_solar (assume all production is consumed)
-
-                if energy_from_battery_data and energy_to_battery_data:
-                    df_energy_from_battery = PlotPV.process_pv_data(energy_from_battery_data, start_datetime, end_datetime)
-                    df_energy_to_battery = PlotPV.process_pv_data(energy_to_battery_data, start_datetime, end_datetime)
-                else:
-                    df_energy_from_battery = None
-                    df_energy_to_battery = None
-
-                # # Debug logging
-                # st.write(f"Debug - {instance}:")
-                # st.write(f"df_import_plts: {df_import_plts is not None}")
-                # st.write(f"df_import_pln: {df_import_pln is not None}")
-                # st.write(f"df_export_pln: {df_export_pln is not None}")
-                # st.write(f"df_consumed_solar: {df_consumed_solar is not None}")
-
-                if df_import_plts is not None and df_import_pln is not None and df_consumed_solar is not None:
-                    PlotPV.render_energy_usage(df_consumed_solar, df_import_pln, df_export_pln, df_energy_from_battery, df_energy_to_battery)
+    end_datetime = local_end.replace(tzinfo=LOCAL_TZ)
+
+    granularity = select_granularity(start_datetime, end_datetime, granularity_choice)
+
+    # Rencanakan semua series sekali, fetch paralel, lalu proses tiap series tepat satu kali
+    site_entities = {instance: registry.get(instance).entities for instance in instances}
+    series_plan = plan_series(site_entities, PANELS, start_datetime, end_datetime, granularity)
+    day_cache = get_day_cache()
+    # Site yang lewat deadline tidak ditunggu: tampil dengan data cache terakhir, fetch lanjut di background
+    deadlines = {instance: get_site_deadline(instance) for instance in instances}
+    results, stale = fetch_all(
+        ha_apis, fetch_requests(series_plan), store=get_history_store(), cache=day_cache, deadlines=deadlines
+    )
+    balances = load_balances(series_plan, day_cache, results, stale)
+
+    # Semua site digabung sekali; ringkasan fleet dan grafik per site membaca frame yang sama
+    fleet = FleetView.build(balances)
+    ui.render_fleet(fleet, granularity)
+
+    # Live hanya berguna kalau range mencakup hari ini
+    live = live_mode and start_date <= datetime.datetime.now(LOCAL_TZ).date() <= end_date
+    site_fragment = st.fragment(render_site, run_every=LIVE_INTERVAL if live else None)
+    plan_by_site = site_series(series_plan)
+
+    # Tiap site satu fragment, COLUMNS_PER_ROW site per baris
+    for row_start in range(0, len(instances), COLUMNS_PER_ROW):
+        row_instances = instances[row_start:row_start + COLUMNS_PER_ROW]
+        for instance, col in zip(row_instances, st.columns(COLUMNS_PER_ROW)):
+            with col:
+                site_fragment(
+                    instance, plan_by_site.get(instance), fleet.site_frame(instance), granularity, live,
+                    instance in stale,
+                )
+
+    # Diagnostics di sidebar dan export metrik
+    ui.render_diagnostics(metrics)
+    if metrics_config.get("prometheus_file"):
+        metrics.write_prometheus(metrics_config["prometheus_file"])
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,82 @@
+"""Micro-benchmark PlotPV.hourly_levels (vectorized) vs implementasi loop lama.
+
+Jalankan dari root repo:
+    python -m benchmarks.bench_process_pv
+"""
+import argparse
+import datetime
+import random
+import timeit
+
+import pandas as pd
+
+from energy_series import LOCAL_TZ
+from ui import PlotPV
+
+
+def make_payload(rows, interval_seconds=10, seed=0):
+    """Payload /api/history/period sintetis: satu counter energi yang naik terus"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    value = 1000.0
+    entries = []
+    for i in range(rows):
+        ts = (start + datetime.timedelta(seconds=i * interval_seconds)).isoformat()
+        value += rng.random() * 0.01
+        entries.append({
+            "entity_id": "sensor.pv_energy_total",
+            "state": f"{value:.3f}" if rng.random() > 0.001 else "unavailable",
+            "attributes": {"unit_of_measurement": "kWh", "device_class": "energy"},
+            "last_changed": ts,
+            "last_updated": ts,
+        })
+    return [entries], start, start + datetime.timedelta(seconds=rows * interval_seconds)
+
+
+def legacy_hourly_levels(raw_data, requested_start, requested_end):
+    """Implementasi lama (loop per baris), dipakai sebagai pembanding"""
+    data_points = []
+    for entry in raw_data[0]:
+        timestamp = entry.get('last_updated') or entry.get('last_changed')
+        state = entry.get('state')
+        if timestamp and state:
+            try:
+                value = float(state)
+                ts = pd.to_datetime(timestamp).tz_convert('Asia/Jakarta')
+                data_points.append({'timestamp': ts, 'value': value})
+            except (ValueError, TypeError):
+                continue
+    if not data_points:
+        return None
+    df = pd.DataFrame(data_points)
+    df.set_index('timestamp', inplace=True)
+    df = df.sort_index()
+    df = df[~df.index.duplicated(keep='first')]
+    req_start = pd.to_datetime(requested_start).tz_convert('Asia/Jakarta')
+    req_end = pd.to_datetime(requested_end).tz_convert('Asia/Jakarta')
+    df_filtered = df[(df.index >= req_start) & (df.index <= req_end)]
+    return df_filtered.resample('h').ffill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>8}")
+    for rows in args.rows:
+        raw_data, start, end = make_payload(rows)
+        start, end = start.astimezone(LOCAL_TZ), end.astimezone(LOCAL_TZ)
+
+        expected = legacy_hourly_levels(raw_data, start, end)
+        actual = PlotPV.hourly_levels(raw_data, start, end)
+        pd.testing.assert_frame_equal(actual, expected, check_freq=False)
+
+        legacy = min(timeit.repeat(lambda: legacy_hourly_levels(raw_data, start, end), number=1, repeat=args.repeat))
+        vectorized = min(timeit.repeat(lambda: PlotPV.hourly_levels(raw_data, start, end), number=1, repeat=args.repeat))
+        print(f"{rows:>8} {legacy:>12.4f} {vectorized:>15.4f} {legacy / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
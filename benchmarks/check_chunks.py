@@ -0,0 +1,68 @@
+"""Cek offline fetch histori per chunk: hasil stitch harus sama persis dengan satu request utuh.
+
+Jalankan dari root repo (exit code 1 kalau ada entity yang berbeda):
+    python -m benchmarks.check_chunks
+"""
+import datetime
+import logging
+import sys
+
+import streamlit.logger
+
+from benchmarks.stub_http_server import StubHTTPServer
+from benchmarks.stub_ws_server import STUB_TOKEN
+from energy_series import LOCAL_TZ
+from home_assistant_api import HomeAssistantAPI
+
+ENTITY_IDS = ["sensor.import_energy_plts", "sensor.import_energy_pln"]
+# Batas range sengaja tidak di tengah malam / awal jam
+START = datetime.datetime(2024, 6, 1, 3, 17, tzinfo=LOCAL_TZ)
+END = datetime.datetime(2024, 6, 21, 11, 5, tzinfo=LOCAL_TZ)
+# Target kecil supaya range di atas terpecah jadi banyak chunk
+CHUNK_TARGET_BYTES = 200_000
+SCENARIOS = {
+    "bersih": {},
+    "reset+gap": {"reset_probability": 0.001, "gap_probability": 0.002},
+}
+
+
+def _rows(entries):
+    """(state, epoch) per baris; format timestamp bisa berbeda antara response dan hasil stitch"""
+    return [
+        (entry.get("state"), datetime.datetime.fromisoformat(entry.get("last_updated") or entry.get("last_changed")).timestamp())
+        for entry in entries
+    ]
+
+
+def run_checks():
+    """Return list (skenario, entity) yang hasil stitch-nya berbeda"""
+    failures = []
+    for name, options in SCENARIOS.items():
+        with StubHTTPServer(**options) as server:
+            ha_api = HomeAssistantAPI("Stub", config={
+                "url": server.url, "token": STUB_TOKEN, "chunk_target_bytes": CHUNK_TARGET_BYTES,
+            })
+            chunked = ha_api.get_pv_statistics_bulk(START, END, ENTITY_IDS)
+            requests = server.history_requests
+            single, _ = ha_api._request_history(START, END, ",".join(ENTITY_IDS))
+
+        for entity_id, series in zip(ENTITY_IDS, single):
+            stitched = _rows(chunked[entity_id][0]) if chunked and chunked.get(entity_id) else []
+            expected = _rows(series)
+            ok = stitched == expected
+            print(f"{'ok  ' if ok else 'FAIL'} {name} {entity_id}: {requests} chunk, {len(stitched)}/{len(expected)} baris")
+            if not ok:
+                failures.append((name, entity_id))
+    return failures
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    streamlit.logger.set_log_level(logging.ERROR)
+    failures = run_checks()
+    print(f"{len(failures)} cek gagal" if failures else "semua cek lolos")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Cek offline sumber long-term statistics recap_export terhadap stub websocket HA.
+
+Energy balance dari statistics (recorder/statistics_during_period) harus sama dengan yang dihitung
+dari raw histori untuk range yang sama. Jalankan dari root repo (exit code 1 kalau ada cek yang gagal):
+    python -m benchmarks.check_statistics
+"""
+import dataclasses
+import datetime
+import logging
+import sys
+
+import numpy as np
+import streamlit.logger
+
+from benchmarks.stub_ws_server import STUB_TOKEN, StubWebSocketServer
+from recap_export import ExportJob, run_job
+from site_registry import Site
+
+SITE = Site("Stub", entities={
+    "import_plts": "sensor.import_energy_plts",
+    "import_pln": "sensor.import_energy_pln",
+    "export_pln": "sensor.export_energy_pln",
+})
+FIRST_DAY = datetime.date(2024, 6, 1)
+LAST_DAY = datetime.date(2024, 6, 10)
+# State histori dibulatkan 3 desimal, selisih per jam boleh berbeda sedikit
+TOLERANCE = 0.01
+
+
+def run_checks(server):
+    """Return list cek yang gagal"""
+    failures = []
+
+    def check(ok, description):
+        print(f"{'ok  ' if ok else 'FAIL'} {description}")
+        if not ok:
+            failures.append(description)
+
+    config = {"url": server.url, "token": STUB_TOKEN}
+    history_job = ExportJob(SITE, config, FIRST_DAY, LAST_DAY, source="history")
+    statistics_job = dataclasses.replace(history_job, source="statistics")
+
+    from_history = run_job(history_job)
+    from_statistics = run_job(statistics_job)
+    check(from_statistics is not None, "energy balance dari statistics terisi")
+    if from_history is None or from_statistics is None:
+        return failures
+
+    check(from_statistics.columns == from_history.columns, f"kolom sama: {from_statistics.columns}")
+    check(np.array_equal(from_statistics.hours, from_history.hours), f"jam sama: {len(from_statistics.hours)} jam")
+    if from_statistics.columns == from_history.columns and np.array_equal(from_statistics.hours, from_history.hours):
+        difference = float(np.abs(from_statistics.values - from_history.values).max())
+        check(difference <= TOLERANCE, f"nilai per jam sama dengan histori (selisih maks {difference:.4f} kWh)")
+
+    bad_job = dataclasses.replace(statistics_job, config={**config, "token": "salah"})
+    try:
+        run_job(bad_job)
+        check(False, "statistics gagal -> job raise")
+    except RuntimeError:
+        check(True, "statistics gagal -> job raise")
+    return failures
+
+
+def main():
+    logging.basicConfig(level=logging.CRITICAL)
+    streamlit.logger.set_log_level(logging.ERROR)
+    with StubWebSocketServer() as server:
+        failures = run_checks(server)
+    print(f"{len(failures)} cek gagal" if failures else "semua cek lolos")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Cek offline StateStream terhadap stub websocket HA: subscribe, merge ke DayCache dan reconnect.
+
+Jalankan dari root repo (exit code 1 kalau ada cek yang gagal):
+    python -m benchmarks.check_stream
+"""
+import datetime
+import logging
+import sys
+import time
+
+import streamlit.logger
+
+from benchmarks.stub_ws_server import STUB_TOKEN, StubWebSocketServer
+from day_cache import DayCache
+from energy_series import LOCAL_TZ
+from home_assistant_api import HomeAssistantAPI
+from site_registry import Site
+from state_stream import StateStream
+
+SITE = Site("Stub", entities={
+    "import_plts": "sensor.import_energy_plts",
+    "import_pln": "sensor.import_energy_pln",
+})
+PUSH_INTERVAL = 0.2
+RECONNECT_DELAY = 0.3
+# Batas tunggu (detik) sampai stream berada di kondisi yang diharapkan
+WAIT_TIMEOUT = 5
+# TTL slice hari ini di DayCache, pendek supaya kedaluwarsa selama cek counter diam
+TODAY_TTL = 1
+
+
+def wait_for(condition, timeout=WAIT_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def run_checks(server):
+    """Return list cek yang gagal"""
+    failures = []
+
+    def check(ok, description):
+        print(f"{'ok  ' if ok else 'FAIL'} {description}")
+        if not ok:
+            failures.append(description)
+
+    # Tanpa retry dan dengan breaker yang langsung half-open supaya reconnect tidak menunggu
+    ha_api = HomeAssistantAPI(SITE.name, config={
+        "url": server.url, "token": STUB_TOKEN,
+        "max_retries": 0, "chunk_retries": 0, "reset_timeout": 0,
+    })
+    entity_ids = list(SITE.entities.values())
+    stream = StateStream(SITE, ha_api, buffer_size=64, reconnect_delay=RECONNECT_DELAY).start()
+    try:
+        check(wait_for(lambda: stream.connected.is_set() and all(stream.buffers.values())),
+              "subscribe: tersambung dan buffer semua entity terisi")
+
+        day_cache = DayCache(today_ttl=TODAY_TTL)
+        check(not stream.merge_into(day_cache), "merge tanpa slice hari ini di cache -> fallback polling")
+
+        now = datetime.datetime.now(LOCAL_TZ)
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        day_cache.get_pv_statistics_bulk(ha_api.get_pv_statistics_bulk, SITE.name, day_start, now, entity_ids)
+        before = {entity_id: day_cache.last_timestamp(SITE.name, entity_id, now.date()) for entity_id in entity_ids}
+        check(None not in before.values(), "slice hari ini diambil dari history stub")
+
+        time.sleep(PUSH_INTERVAL * 3)
+        check(stream.merge_into(day_cache), "merge dengan slice hari ini di cache")
+        after = {entity_id: day_cache.last_timestamp(SITE.name, entity_id, now.date()) for entity_id in entity_ids}
+        check(None not in before.values() and all(after[entity_id] > before[entity_id] for entity_id in entity_ids),
+              "merge menambah state baru ke cache")
+
+        # Putus saat history gagal: reconcile gagal, stream harus tetap dianggap terputus
+        server.history_error = True
+        requests_before = server.history_requests
+        server.drop_connections()
+        check(wait_for(lambda: server.history_requests > requests_before + 1),
+              "reconnect mencoba reconcile dari history")
+        check(not stream.connected.is_set(), "reconcile gagal -> tetap terputus")
+        check(not stream.merge_into(day_cache), "reconcile gagal -> merge_into False")
+
+        server.history_error = False
+        check(wait_for(stream.connected.is_set), "history pulih -> tersambung lagi")
+        time.sleep(PUSH_INTERVAL * 3)
+        check(stream.merge_into(day_cache), "merge lagi setelah reconnect")
+        latest = {entity_id: day_cache.last_timestamp(SITE.name, entity_id, now.date()) for entity_id in entity_ids}
+        check(all(latest[entity_id] > after[entity_id] for entity_id in entity_ids),
+              "state setelah reconnect masuk ke cache")
+
+        # Counter yang diam (misal PV di malam hari) harus tetap ada di cache lewat TTL-nya
+        frozen = SITE.entities["import_plts"]
+        server.frozen_entities.add(frozen)
+        time.sleep(PUSH_INTERVAL * 2)
+        merged_until = time.monotonic() + TODAY_TTL * 2
+        while time.monotonic() < merged_until:
+            stream.merge_into(day_cache)
+            time.sleep(PUSH_INTERVAL)
+        now = datetime.datetime.now(LOCAL_TZ)
+        check(all(day_cache.get_levels(SITE.name, entity_id, day_start, now) is not None for entity_id in entity_ids),
+              "counter diam tetap ada di cache setelah TTL lewat")
+    finally:
+        stream.stop()
+    return failures
+
+
+def main():
+    logging.basicConfig(level=logging.ERROR)
+    streamlit.logger.set_log_level(logging.ERROR)
+    with StubWebSocketServer(push_interval=PUSH_INTERVAL) as server:
+        failures = run_checks(server)
+    print(f"{len(failures)} cek gagal" if failures else "semua cek lolos")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
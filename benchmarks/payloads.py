@@ -0,0 +1,99 @@
+"""Generator payload /api/history/period sintetis untuk benchmark.
+
+Counter energi naik terus (kurva matahari untuk PV, beban konstan untuk lainnya) dengan
+sample rate yang bisa diatur, plus attributes, reset counter dan gap (unavailable) acak.
+
+Semua nilai diturunkan dari waktu absolut (lihat `stub_ws_server.counter_value`): sample ada di
+kelipatan `sample_seconds`, reset dan gap ditentukan per jam / per blok, jadi request yang
+dipecah atau tumpang tindih mengembalikan state yang sama untuk momen yang sama.
+"""
+import datetime
+import random
+import zlib
+
+from benchmarks.stub_ws_server import counter_value, cumulative_energy
+
+ATTRIBUTES = {
+    "state_class": "total_increasing",
+    "unit_of_measurement": "kWh",
+    "device_class": "energy",
+    "friendly_name": "Energy",
+}
+# Reset counter dicari mundur paling jauh sampai awal blok ini (jam), supaya tetap terbatas
+RESET_EPOCH_HOURS = 30 * 24
+
+
+def _chance(salt, kind, index):
+    """Angka 0..1 yang tetap untuk (salt, jenis, index)"""
+    return zlib.crc32(f"{salt}:{kind}:{index}".encode()) / 2 ** 32
+
+
+def _reset_hour(salt, hour, probability, known):
+    """Jam absolut (epoch/3600) reset terakhir sampai `hour`, atau None kalau belum ada di blok ini
+
+    `known` menyimpan hasil jam-jam sebelumnya supaya sample berikutnya cukup cek satu jam.
+    """
+    if hour not in known:
+        if _chance(salt, "reset", hour) < probability:
+            known[hour] = hour
+        elif hour % RESET_EPOCH_HOURS == 0:
+            known[hour] = None
+        elif hour - 1 in known:
+            known[hour] = known[hour - 1]
+        else:
+            epoch_start = hour - hour % RESET_EPOCH_HOURS
+            known[hour] = next(
+                (candidate for candidate in range(hour - 1, epoch_start - 1, -1)
+                 if _chance(salt, "reset", candidate) < probability),
+                None,
+            )
+    return known[hour]
+
+
+def generate_history(entity_id, start, end, sample_seconds=60, reset_probability=0.0,
+                     gap_probability=0.0, gap_minutes=30, minimal_response=False,
+                     no_attributes=False, seed=None):
+    """List state satu entity antara start dan end, format sama dengan response HA
+
+    `reset_probability` dan `gap_probability` per sample, dikonversi ke peluang per jam / per blok gap.
+    """
+    salt = entity_id if seed is None else seed
+    rng = random.Random(f"{salt}:{start.timestamp()}")
+    gap_seconds = gap_minutes * 60
+    reset_chance = min(1.0, reset_probability * 3600 / sample_seconds)
+    gap_chance = min(1.0, gap_probability * gap_seconds / sample_seconds)
+    resets = {}
+
+    def state_at(moment):
+        ts = moment.timestamp()
+        if gap_chance and _chance(salt, "gap", int(ts // gap_seconds)) < gap_chance:
+            return "unavailable", datetime.datetime.fromtimestamp(
+                (ts // gap_seconds + 1) * gap_seconds, tz=moment.tzinfo
+            )
+        next_moment = datetime.datetime.fromtimestamp((ts // sample_seconds + 1) * sample_seconds, tz=moment.tzinfo)
+        reset = _reset_hour(salt, int(ts // 3600), reset_chance, resets) if reset_chance else None
+        if reset is None:
+            return f"{counter_value(entity_id, moment):.3f}", next_moment
+        reset_moment = datetime.datetime.fromtimestamp(reset * 3600, tz=moment.tzinfo)
+        value = cumulative_energy(entity_id, moment) - cumulative_energy(entity_id, reset_moment)
+        return f"{value:.3f}", next_moment
+
+    entries = []
+    moment = start
+    while moment <= end:
+        state, next_moment = state_at(moment)
+        timestamp = moment.astimezone(datetime.timezone.utc).isoformat()
+        if minimal_response and entries:
+            # Sama seperti HA: selain baris pertama hanya state dan last_changed
+            entries.append({"state": state, "last_changed": timestamp})
+        else:
+            entry = {"entity_id": entity_id, "state": state}
+            if not no_attributes:
+                entry["attributes"] = dict(ATTRIBUTES, friendly_name=entity_id)
+            entry["last_changed"] = timestamp
+            entry["last_updated"] = timestamp
+            if not minimal_response:
+                entry["context"] = {"id": f"{rng.getrandbits(64):016x}", "parent_id": None, "user_id": None}
+            entries.append(entry)
+        moment = next_moment
+    return entries
@@ -0,0 +1,158 @@
+"""Benchmark pipeline dashboard (fetch -> proses -> figure) terhadap stub HA lokal.
+
+Jalankan dari root repo:
+    python -m benchmarks.run_pipeline --days 1 7 30 365 --sites 4 50 --output results.json
+    python -m benchmarks.run_pipeline --compare results.json   # gagal kalau ada regresi
+"""
+import argparse
+import datetime
+import json
+import logging
+import sys
+import time
+
+import streamlit.logger
+from streamlit import config as streamlit_config
+
+import plot_data
+from aggregation import select_granularity
+from app import PANEL_RENDERERS
+from benchmarks.stub_http_server import StubHTTPServer
+from benchmarks.stub_ws_server import STUB_TOKEN
+from day_cache import DayCache
+from energy_series import LOCAL_TZ
+from fleet import FleetView
+from fetcher import fetch_all
+from home_assistant_api import HomeAssistantAPI
+from planner import PANELS, fetch_requests, load_balances, plan_series
+from site_registry import ROLES
+
+# Range selalu berakhir di tanggal tetap supaya hasil antar run bisa dibandingkan
+END_DATE = datetime.date(2024, 6, 30)
+SITE_ENTITIES = {
+    role: None for role in ROLES
+} | {
+    "import_plts": "sensor.import_energy_plts",
+    "import_pln": "sensor.import_energy_pln",
+    "export_pln": "sensor.export_energy_pln",
+}
+STAGES = ("fetch_s", "process_s", "figure_s", "warm_s", "total_s")
+
+
+def run_scenario(url, days, sites):
+    """Satu skenario: cold fetch + proses + figure, lalu rerun dengan cache hangat"""
+    start_datetime = datetime.datetime.combine(END_DATE - datetime.timedelta(days=days - 1), datetime.time(0, 0), tzinfo=LOCAL_TZ)
+    end_datetime = datetime.datetime.combine(END_DATE, datetime.time(23, 59), tzinfo=LOCAL_TZ)
+    granularity = select_granularity(start_datetime, end_datetime)
+
+    instances = [f"Site{number:02d}" for number in range(1, sites + 1)]
+    ha_apis = {
+        instance: HomeAssistantAPI(instance, config={"url": url, "token": STUB_TOKEN})
+        for instance in instances
+    }
+    site_entities = {instance: SITE_ENTITIES for instance in instances}
+    series_plan = plan_series(site_entities, PANELS, start_datetime, end_datetime, granularity)
+    day_cache = DayCache()
+    plot_data._figure_cache.clear()
+
+    started = time.perf_counter()
+    results, _ = fetch_all(ha_apis, fetch_requests(series_plan), cache=day_cache)
+    fetched = time.perf_counter()
+    fleet = FleetView.build(load_balances(series_plan, day_cache, results))
+    processed = time.perf_counter()
+    for instance in instances:
+        site_frame = fleet.site_frame(instance)
+        for panel in PANELS:
+            if site_frame is not None and all(column in site_frame.columns for column in panel.required):
+                PANEL_RENDERERS[panel.key](site_frame, granularity, key=f"{instance}_{panel.key}", site=instance)
+    rendered = time.perf_counter()
+
+    # Rerun: data sudah ada di cache, figure cache dikosongkan lagi
+    plot_data._figure_cache.clear()
+    warm_start = time.perf_counter()
+    results, _ = fetch_all(ha_apis, fetch_requests(series_plan), cache=day_cache)
+    load_balances(series_plan, day_cache, results)
+    warm_end = time.perf_counter()
+
+    rows = sum(len(series[0]) for site in results.values() for series in site.values() if series)
+    return {
+        "days": days,
+        "sites": sites,
+        "granularity": granularity,
+        "rows": rows,
+        "fetch_s": round(fetched - started, 4),
+        "process_s": round(processed - fetched, 4),
+        "figure_s": round(rendered - processed, 4),
+        "warm_s": round(warm_end - warm_start, 4),
+        "total_s": round(rendered - started, 4),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Bandingkan dengan hasil sebelumnya, return daftar regresi (> tolerance lebih lambat)"""
+    baseline_by_key = {(item["days"], item["sites"]): item for item in baseline}
+    regressions = []
+    for item in results:
+        previous = baseline_by_key.get((item["days"], item["sites"]))
+        if previous is None:
+            continue
+        for stage in STAGES:
+            # Abaikan stage yang terlalu cepat untuk diukur stabil
+            if previous[stage] >= 0.01 and item[stage] > previous[stage] * (1 + tolerance):
+                regressions.append(
+                    f"{item['days']}d x {item['sites']} site {stage}: {previous[stage]:.3f}s -> {item[stage]:.3f}s"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, nargs="+", default=[1, 7, 30, 365])
+    parser.add_argument("--sites", type=int, nargs="+", default=[4, 50])
+    parser.add_argument("--latency", type=float, default=0.05, help="latency stub per request (detik)")
+    parser.add_argument("--sample-seconds", type=int, default=300, help="interval sample counter")
+    parser.add_argument("--reset-probability", type=float, default=0.0001)
+    parser.add_argument("--gap-probability", type=float, default=0.0005)
+    parser.add_argument("--output", help="simpan hasil sebagai JSON")
+    parser.add_argument("--compare", help="file JSON hasil sebelumnya untuk deteksi regresi")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    # Tanpa `streamlit run` setiap st.* memunculkan warning ScriptRunContext; config dibaca
+    # dulu supaya level dari config tidak menimpa level ini saat st.* pertama dipanggil
+    streamlit_config.get_config_options()
+    streamlit.logger.set_log_level(logging.ERROR)
+
+    server = StubHTTPServer(
+        latency=args.latency,
+        sample_seconds=args.sample_seconds,
+        reset_probability=args.reset_probability,
+        gap_probability=args.gap_probability,
+    )
+    results = []
+    with server:
+        print(f"{'days':>5} {'sites':>5} {'gran':>6} {'rows':>9} " + " ".join(f"{stage:>10}" for stage in STAGES))
+        for days in args.days:
+            for sites in args.sites:
+                result = run_scenario(server.url, days, sites)
+                results.append(result)
+                print(
+                    f"{days:>5} {sites:>5} {result['granularity']:>6} {result['rows']:>9} "
+                    + " ".join(f"{result[stage]:>10.3f}" for stage in STAGES)
+                )
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESI {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
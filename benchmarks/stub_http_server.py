@@ -0,0 +1,144 @@
+"""Stub server HTTP Home Assistant (/api/history/period dan /api/states) untuk benchmark offline.
+
+    python -m benchmarks.stub_http_server --port 8124 --latency 0.2
+    # [Eddie02] url = "http://127.0.0.1:8124", token = "stub-token"
+"""
+import argparse
+import datetime
+import functools
+import json
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.payloads import generate_history
+from benchmarks.stub_ws_server import STUB_TOKEN
+
+
+class StubHTTPServer:
+    """Server HTTP HA palsu di background thread dengan latency yang bisa diatur"""
+
+    def __init__(self, host="127.0.0.1", port=0, token=STUB_TOKEN, latency=0.0,
+                 sample_seconds=60, reset_probability=0.0, gap_probability=0.0, error_probability=0.0):
+        self.token = token
+        self.latency = latency
+        # Peluang request history dijawab 503 (host HA yang kewalahan)
+        self.error_probability = error_probability
+        self.history_requests = 0
+        self.payload_options = {
+            "sample_seconds": sample_seconds,
+            "reset_probability": reset_probability,
+            "gap_probability": gap_probability,
+        }
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @functools.lru_cache(maxsize=256)
+    def history_body(self, entity_ids, start, end, minimal_response, no_attributes):
+        """Body JSON history; di-cache supaya banyak site dengan entity sama tidak generate ulang"""
+        start_time = datetime.datetime.fromisoformat(start)
+        end_time = min(datetime.datetime.fromisoformat(end), datetime.datetime.now(datetime.timezone.utc))
+        series = [
+            generate_history(
+                entity_id, start_time, end_time,
+                minimal_response=minimal_response, no_attributes=no_attributes,
+                **self.payload_options,
+            )
+            for entity_id in entity_ids
+        ]
+        return json.dumps(series).encode()
+
+    def states_body(self):
+        states = [
+            {"entity_id": f"sensor.stub_{name}", "state": str(value), "attributes": {}}
+            for name, value in [("power", 1200), ("energy", 35.2), ("battery", 81), ("temperature", 31.5)]
+        ]
+        return json.dumps(states).encode()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if self.headers.get("Authorization") != f"Bearer {stub.token}":
+                    return self.reply(401, b'{"message": "Unauthorized"}')
+
+                parsed = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(parsed.query, keep_blank_values=True)
+                if parsed.path.startswith("/api/history/period/"):
+                    stub.history_requests += 1
+                    if random.random() < stub.error_probability:
+                        return self.reply(503, b'{"message": "Service unavailable"}')
+                    start = urllib.parse.unquote(parsed.path.rsplit("/", 1)[-1])
+                    end = query.get("end_time", [datetime.datetime.now(datetime.timezone.utc).isoformat()])[0]
+                    entity_ids = tuple(query.get("filter_entity_id", [""])[0].split(","))
+                    body = stub.history_body(
+                        entity_ids, start, end, "minimal_response" in query, "no_attributes" in query
+                    )
+                    return self.reply(200, body)
+                if parsed.path == "/api/states":
+                    return self.reply(200, stub.states_body())
+                return self.reply(404, b'{"message": "Not found"}')
+
+            def reply(self, status, body):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8124)
+    parser.add_argument("--token", default=STUB_TOKEN)
+    parser.add_argument("--latency", type=float, default=0.0, help="delay per request (detik)")
+    parser.add_argument("--sample-seconds", type=int, default=60)
+    parser.add_argument("--reset-probability", type=float, default=0.0)
+    parser.add_argument("--gap-probability", type=float, default=0.0)
+    parser.add_argument("--error-probability", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = StubHTTPServer(
+        args.host, args.port, args.token, args.latency,
+        args.sample_seconds, args.reset_probability, args.gap_probability, args.error_probability,
+    )
+    print(f"Stub HA HTTP di {server.url} (token: {args.token})")
+    server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
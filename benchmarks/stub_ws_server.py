@@ -0,0 +1,276 @@
+"""Stub server websocket Home Assistant untuk testing offline.
+
+Mendukung handshake auth, command `recorder/statistics_during_period` dan langganan
+`subscribe_entities` (push perubahan counter energi sintetis tiap `push_interval` detik).
+Request HTTP biasa ke /api/history/period dijawab dari counter yang sama, jadi satu stub cukup
+untuk StateStream (subscribe + reconcile).
+Bisa dijalankan langsung lalu dipakai di secrets.toml:
+    python -m benchmarks.stub_ws_server --port 8123
+    # [Eddie02] url = "http://127.0.0.1:8123", token = "stub-token"
+"""
+import argparse
+import datetime
+import functools
+import json
+import math
+import threading
+import time
+import urllib.parse
+import zlib
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.server import serve
+
+from energy_series import LOCAL_TZ
+
+STUB_TOKEN = "stub-token"
+
+
+def hourly_change(statistic_id, hour_start):
+    """Energi sintetis (kWh) per jam: kurva matahari untuk PV, konstan kecil untuk lainnya"""
+    local_hour = hour_start.astimezone(LOCAL_TZ).hour
+    if "pv" in statistic_id or "plts" in statistic_id:
+        return round(max(0.0, math.sin(math.pi * (local_hour - 6) / 12)) * 5, 3)
+    return 0.5
+
+
+@functools.lru_cache(maxsize=256)
+def _daily_changes(entity_id):
+    """Energi kumulatif di awal tiap jam lokal (0..24) dalam satu hari"""
+    day = datetime.datetime(2024, 1, 1, tzinfo=LOCAL_TZ)
+    totals = [0.0]
+    for hour in range(24):
+        totals.append(totals[-1] + hourly_change(entity_id, day + datetime.timedelta(hours=hour)))
+    return totals
+
+
+def cumulative_energy(entity_id, moment):
+    """Total energi (kWh) sejak epoch menurut hourly_change, hanya bergantung pada waktu absolut"""
+    local_seconds = moment.timestamp() + LOCAL_TZ.utcoffset(None).total_seconds()
+    days, seconds = divmod(local_seconds, 86400)
+    hour, fraction = divmod(seconds / 3600, 1)
+    totals = _daily_changes(entity_id)
+    hour = int(hour)
+    return days * totals[24] + totals[hour] + fraction * (totals[hour + 1] - totals[hour])
+
+
+def counter_value(entity_id, moment):
+    """State counter sintetis (kWh) yang naik terus, berbeda per entity.
+
+    Dihitung dari waktu absolut, jadi request yang dipecah / tumpang tindih dan event
+    websocket selalu melihat nilai yang sama untuk momen yang sama.
+    """
+    return round(zlib.crc32(entity_id.encode()) % 10000 + cumulative_energy(entity_id, moment), 3)
+
+
+def period_start(moment, period):
+    """Awal bucket period (day/week/month dihitung di timezone lokal seperti HA)"""
+    local = moment.astimezone(LOCAL_TZ)
+    if period == "hour":
+        return local.replace(minute=0, second=0, microsecond=0)
+    day = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "day":
+        return day
+    if period == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Period tidak didukung: {period}")
+
+
+def period_end(bucket_start, period):
+    if period == "hour":
+        return bucket_start + datetime.timedelta(hours=1)
+    if period == "day":
+        return bucket_start + datetime.timedelta(days=1)
+    if period == "week":
+        return bucket_start + datetime.timedelta(weeks=1)
+    return period_start(bucket_start + datetime.timedelta(days=32), "month")
+
+
+def statistics_during_period(statistic_ids, start_time, end_time, period):
+    """Hasil statistics_during_period sintetis, format sama dengan HA (waktu epoch ms)"""
+    start = datetime.datetime.fromisoformat(start_time)
+    end = datetime.datetime.fromisoformat(end_time) if end_time else datetime.datetime.now(datetime.timezone.utc)
+    first_hour = start.replace(minute=0, second=0, microsecond=0)
+
+    result = {}
+    for statistic_id in statistic_ids:
+        buckets = {}
+        moment = first_hour
+        while moment < end:
+            bucket = period_start(moment, period)
+            buckets[bucket] = buckets.get(bucket, 0.0) + hourly_change(statistic_id, moment)
+            moment += datetime.timedelta(hours=1)
+        result[statistic_id] = [
+            {
+                "start": bucket_start.timestamp() * 1000,
+                "end": period_end(bucket_start, period).timestamp() * 1000,
+                "change": round(change, 3),
+            }
+            for bucket_start, change in buckets.items()
+        ]
+    return result
+
+
+class StubWebSocketServer:
+    """Server websocket HA palsu yang jalan di background thread"""
+
+    def __init__(self, host="127.0.0.1", port=0, token=STUB_TOKEN, latency=0.0, push_interval=1.0):
+        self.token = token
+        self.latency = latency
+        self.push_interval = push_interval
+        # True = request history dijawab 503 (untuk menguji reconcile yang gagal)
+        self.history_error = False
+        self.history_requests = 0
+        # Entity yang counternya berhenti berubah (tidak ikut event "c", misal PV di malam hari)
+        self.frozen_entities = set()
+        self.connections = set()
+        self.server = serve(self.handle, host, port, max_size=None, process_request=self.process_request)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        """Base URL HTTP (sama seperti di secrets), client sendiri yang ubah ke ws://"""
+        host, port = self.server.socket.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def drop_connections(self):
+        """Putus semua koneksi client (untuk menguji reconnect)"""
+        for ws in list(self.connections):
+            ws.close()
+
+    def process_request(self, connection, request):
+        """Jawab GET /api/history/period/<start> (format minimal_response); request lain lanjut ke websocket"""
+        parsed = urllib.parse.urlparse(request.path)
+        if not parsed.path.startswith("/api/history/period/"):
+            return None
+        if request.headers.get("Authorization") != f"Bearer {self.token}":
+            return self.json_response(connection, 401, {"message": "Unauthorized"})
+        self.history_requests += 1
+        if self.history_error:
+            return self.json_response(connection, 503, {"message": "Service unavailable"})
+
+        # Import di sini: payloads sendiri memakai counter dari modul ini
+        from benchmarks.payloads import generate_history
+
+        query = urllib.parse.parse_qs(parsed.query, keep_blank_values=True)
+        start = datetime.datetime.fromisoformat(urllib.parse.unquote(parsed.path.rsplit("/", 1)[-1]))
+        now = datetime.datetime.now(datetime.timezone.utc)
+        end = min(datetime.datetime.fromisoformat(query.get("end_time", [now.isoformat()])[0]), now)
+        series = [
+            generate_history(
+                entity_id, start, end,
+                minimal_response="minimal_response" in query, no_attributes="no_attributes" in query,
+            )
+            for entity_id in query.get("filter_entity_id", [""])[0].split(",")
+        ]
+        return self.json_response(connection, 200, series)
+
+    @staticmethod
+    def json_response(connection, status, body):
+        response = connection.respond(status, json.dumps(body))
+        del response.headers["Content-Type"]
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    def handle(self, ws):
+        ws.send(json.dumps({"type": "auth_required", "ha_version": "stub"}))
+        message = json.loads(ws.recv())
+        if message.get("type") != "auth" or message.get("access_token") != self.token:
+            ws.send(json.dumps({"type": "auth_invalid", "message": "Invalid access token"}))
+            return
+        ws.send(json.dumps({"type": "auth_ok", "ha_version": "stub"}))
+
+        self.connections.add(ws)
+        try:
+            for raw in ws:
+                message = json.loads(raw)
+                if self.latency:
+                    time.sleep(self.latency)
+                ws.send(json.dumps(self.dispatch(ws, message)))
+                if message.get("type") == "subscribe_entities":
+                    threading.Thread(target=self.push_states, args=(ws, message), daemon=True).start()
+        except ConnectionClosed:
+            pass
+        finally:
+            self.connections.discard(ws)
+
+    def push_states(self, ws, message):
+        """Event subscribe_entities: snapshot awal ("a") lalu perubahan ("c") tiap push_interval"""
+        entity_ids = message.get("entity_ids", [])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        event = {"a": {
+            entity_id: {"s": str(counter_value(entity_id, now)), "a": {}, "c": "stub", "lc": now.timestamp()}
+            for entity_id in entity_ids
+        }}
+        try:
+            while True:
+                ws.send(json.dumps({"id": message.get("id"), "type": "event", "event": event}))
+                time.sleep(self.push_interval)
+                now = datetime.datetime.now(datetime.timezone.utc)
+                event = {"c": {
+                    entity_id: {"+": {"s": str(counter_value(entity_id, now)), "c": "stub", "lc": now.timestamp()}}
+                    for entity_id in entity_ids
+                    if entity_id not in self.frozen_entities
+                }}
+        except ConnectionClosed:
+            pass
+
+    def dispatch(self, ws, message):
+        """Jawab satu command websocket"""
+        if message.get("type") == "recorder/statistics_during_period":
+            try:
+                result = statistics_during_period(
+                    message.get("statistic_ids", []),
+                    message["start_time"],
+                    message.get("end_time"),
+                    message.get("period", "hour"),
+                )
+            except (KeyError, ValueError) as e:
+                return self.error(message, "invalid_format", str(e))
+            return {"id": message.get("id"), "type": "result", "success": True, "result": result}
+        if message.get("type") == "subscribe_entities":
+            return {"id": message.get("id"), "type": "result", "success": True, "result": None}
+        return self.error(message, "unknown_command", f"Unknown command: {message.get('type')}")
+
+    @staticmethod
+    def error(message, code, text):
+        return {
+            "id": message.get("id"),
+            "type": "result",
+            "success": False,
+            "error": {"code": code, "message": text},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--token", default=STUB_TOKEN)
+    parser.add_argument("--latency", type=float, default=0.0, help="delay per command (detik)")
+    parser.add_argument("--push-interval", type=float, default=1.0, help="jeda event subscribe_entities (detik)")
+    args = parser.parse_args()
+
+    server = StubWebSocketServer(args.host, args.port, args.token, args.latency, args.push_interval)
+    print(f"Stub HA websocket di {server.url}/api/websocket (token: {args.token})")
+    server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
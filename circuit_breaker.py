@@ -0,0 +1,54 @@
+import threading
+import time
+
+# Jumlah kegagalan berturut-turut sebelum site berhenti dipanggil
+FAILURE_THRESHOLD = 3
+# Jeda (detik) sebelum site yang terbuka dicoba lagi dengan satu request probe
+RESET_TIMEOUT = 60
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker per site: setelah beberapa kali gagal berturut-turut, request ke site
+    ditolak tanpa menunggu timeout; setelah `reset_timeout` satu request probe diizinkan,
+    berhasil = tertutup lagi, gagal = terbuka lagi.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def healthy(self):
+        """Tertutup dan request terakhir tidak gagal"""
+        return self.state == CLOSED and self.failures == 0
+
+    def allow(self):
+        """True kalau request boleh dikirim; saat half-open hanya satu probe yang lolos"""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
@@ -0,0 +1,256 @@
+import bisect
+import datetime
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from aggregation import build_rollups
+from energy_balance import energy_balance
+from energy_series import EnergySeries
+from history_store import RECORDER_LAG_SECONDS
+from plot_data import hourly_levels
+
+# Jumlah maksimum slice harian yang disimpan (raw + hourly)
+MAX_ENTRIES = 4096
+# TTL (detik) untuk slice hari yang belum selesai (hari ini)
+TODAY_TTL = 60
+
+
+def _local_days(start_datetime, end_datetime):
+    """Semua tanggal lokal yang tercakup oleh range"""
+    day = start_datetime.date()
+    while day <= end_datetime.date():
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def _day_bounds(day, tz):
+    day_start = datetime.datetime.combine(day, datetime.time(0, 0), tzinfo=tz)
+    return day_start, day_start + datetime.timedelta(days=1)
+
+
+def _split_by_day(entries, days, tz):
+    """Pecah list state HA per hari lokal, tiap hari diawali state yang berlaku jam 00:00"""
+    timestamps = [
+        datetime.datetime.fromisoformat(entry.get("last_updated") or entry.get("last_changed"))
+        for entry in entries
+    ]
+    slices = {}
+    for day in days:
+        day_start, day_end = _day_bounds(day, tz)
+        first = bisect.bisect_left(timestamps, day_start)
+        last = bisect.bisect_left(timestamps, day_end)
+        day_entries = entries[first:last]
+        if first > 0 and (first == len(timestamps) or timestamps[first] > day_start):
+            iso_start = day_start.isoformat()
+            start_state = dict(entries[first - 1], last_updated=iso_start, last_changed=iso_start)
+            day_entries = [start_state] + day_entries
+        slices[day] = day_entries
+    return slices
+
+
+class DayCache:
+    """Cache per (instance, entity, hari lokal).
+
+    Hari yang sudah selesai disimpan tanpa batas waktu (dibuang LRU kalau penuh),
+    hari yang masih berjalan hanya valid selama `today_ttl` detik. Entry yang kedaluwarsa
+    tetap disimpan sampai diganti, supaya site yang sedang lambat/offline masih bisa
+    ditampilkan dengan data terakhir (`stale_ok`).
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, today_ttl=TODAY_TTL):
+        self.max_entries = max_entries
+        self.today_ttl = today_ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get(self, key, stale_ok=False):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if not stale_ok and expires_at is not None and expires_at < time.time():
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def _put(self, key, value, day, tz):
+        _, day_end = _day_bounds(day, tz)
+        completed = day_end.timestamp() + RECORDER_LAG_SECONDS < time.time()
+        expires_at = None if completed else time.time() + self.today_ttl
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def get_pv_statistics_bulk(self, fetch_bulk, instance, start_datetime, end_datetime, entity_ids, stale_ok=False):
+        """Ambil raw histori per hari dari cache, hari yang belum ada di-fetch lewat `fetch_bulk`
+
+        Dengan `fetch_bulk=None` tidak ada request sama sekali: hanya isi cache yang dikembalikan.
+        """
+        entity_ids = [entity_id for entity_id in dict.fromkeys(entity_ids) if entity_id]
+        tz = start_datetime.tzinfo
+        days = list(_local_days(start_datetime, end_datetime))
+
+        slices = {
+            entity_id: {day: self._get(("raw", instance, entity_id, day), stale_ok) for day in days}
+            for entity_id in entity_ids
+        }
+        missing_days = sorted({
+            day for day_slices in slices.values() for day, value in day_slices.items() if value is None
+        })
+        missing_entities = [
+            entity_id for entity_id, day_slices in slices.items() if None in day_slices.values()
+        ]
+
+        if missing_days and fetch_bulk is not None:
+            stored = set()
+
+            def store_days(data, days):
+                for entity_id in missing_entities:
+                    series = data.get(entity_id)
+                    if series is None:
+                        continue
+                    for day, day_entries in _split_by_day(series[0], days, tz).items():
+                        if (entity_id, day) in stored:
+                            continue
+                        slices[entity_id][day] = day_entries
+                        self._put(("raw", instance, entity_id, day), day_entries, day, tz)
+                        stored.add((entity_id, day))
+
+            def store_chunk(chunk_start, chunk_end, data):
+                # Chunk dimulai di tengah malam lokal: hari yang tercakup penuh langsung di-cache,
+                # jadi hasilnya tetap terpakai walaupun chunk lain gagal
+                store_days(data, [
+                    day for day in missing_days
+                    if chunk_start <= _day_bounds(day, tz)[0] and _day_bounds(day, tz)[1] <= chunk_end
+                ])
+
+            # Satu request per rangkaian hari hilang yang berurutan (dipecah per chunk oleh API),
+            # hari yang sudah ada di cache di antaranya tidak di-fetch lagi
+            runs = [[missing_days[0]]]
+            for day in missing_days[1:]:
+                if day - runs[-1][-1] == datetime.timedelta(days=1):
+                    runs[-1].append(day)
+                else:
+                    runs.append([day])
+            for run_days in runs:
+                fetch_start, _ = _day_bounds(run_days[0], tz)
+                _, fetch_end = _day_bounds(run_days[-1], tz)
+                data = fetch_bulk(fetch_start, fetch_end, missing_entities, on_chunk=store_chunk)
+                # Fetch gagal: hanya hari dari chunk yang berhasil (lewat store_chunk) yang di-cache,
+                # sisa datanya tidak lengkap dan tidak boleh disimpan sebagai hari yang sudah selesai
+                if data is not None:
+                    store_days(data, run_days)
+
+        results = {}
+        for entity_id, day_slices in slices.items():
+            entries = [entry for day in days for entry in (day_slices[day] or [])]
+            results[entity_id] = [entries] if entries else None
+        return results
+
+    def last_timestamp(self, instance, entity_id, day):
+        """Timestamp state terakhir di slice raw satu hari (walaupun TTL-nya sudah lewat)"""
+        with self.lock:
+            item = self.entries.get(("raw", instance, entity_id, day))
+        if not item or not item[0]:
+            return None
+        last = item[0][-1]
+        return datetime.datetime.fromisoformat(last.get("last_updated") or last.get("last_changed"))
+
+    def merge_day(self, instance, entity_id, day, tz, entries):
+        """Gabungkan state baru ke slice raw satu hari, lalu buang hasil proses yang sudah basi"""
+        key = ("raw", instance, entity_id, day)
+        with self.lock:
+            item = self.entries.get(key)
+
+        day_entries = _split_by_day(entries, [day], tz)[day]
+        if item and item[0]:
+            last_ts = self.last_timestamp(instance, entity_id, day)
+            new_entries = [
+                entry for entry in day_entries
+                if datetime.datetime.fromisoformat(entry.get("last_updated") or entry.get("last_changed")) > last_ts
+            ]
+            self._put(key, item[0] + new_entries, day, tz)
+            # Tidak ada state baru: hasil proses yang ada masih berlaku
+            if not new_entries:
+                return
+        else:
+            self._put(key, day_entries, day, tz)
+
+        with self.lock:
+            self.entries.pop(("hourly", instance, entity_id, day), None)
+            stale = [
+                cached_key for cached_key in self.entries
+                if cached_key[0] == "balance" and cached_key[1] == instance
+                and entity_id in dict(cached_key[2]).values()
+                and cached_key[3].date() <= day <= cached_key[4].date()
+            ]
+            for cached_key in stale:
+                del self.entries[cached_key]
+
+    def get_levels(self, instance, entity_id, start_datetime, end_datetime, stale_ok=False):
+        """Level counter di setiap awal jam, disusun dari slice harian yang sudah diproses"""
+        tz = start_datetime.tzinfo
+        day_levels = []
+        for day in _local_days(start_datetime, end_datetime):
+            key = ("hourly", instance, entity_id, day)
+            levels = self._get(key, stale_ok)
+            if levels is None:
+                day_entries = self._get(("raw", instance, entity_id, day), stale_ok)
+                if not day_entries:
+                    continue
+                levels = self._day_levels(day_entries, day, tz)
+                if levels is None:
+                    continue
+                # Hasil dari data basi tidak di-cache supaya tidak ikut dianggap segar
+                if not stale_ok:
+                    self._put(key, levels, day, tz)
+            day_levels.append(levels)
+
+        if not day_levels:
+            return None
+
+        # Jam dalam range: awal jam pertama >= start sampai awal jam terakhir <= end
+        first_hour = math.ceil(start_datetime.timestamp() / 3600)
+        last_hour = math.floor(end_datetime.timestamp() / 3600)
+        return EnergySeries.concat(day_levels).between(first_hour, last_hour)
+
+    def get_balance(self, instance, entities, start_datetime, end_datetime, granularity="hour", stale_ok=False):
+        """Energy balance satu site per hour/day/week/month; semua level dihitung sekali lalu di-cache
+
+        `stale_ok`: pakai juga data hari ini yang TTL-nya sudah lewat (site sedang lambat/offline).
+        """
+        key = ("balance", instance, tuple(sorted(entities.items())), start_datetime, end_datetime)
+        rollups = self._get(key, stale_ok)
+        if rollups is None:
+            hourly = energy_balance({
+                role: self.get_levels(instance, entity_id, start_datetime, end_datetime, stale_ok)
+                for role, entity_id in entities.items()
+            })
+            if hourly is None:
+                return None
+            rollups = build_rollups(hourly)
+            if not stale_ok:
+                self._put(key, rollups, end_datetime.date(), start_datetime.tzinfo)
+        return rollups[granularity]
+
+    @staticmethod
+    def _day_levels(day_entries, day, tz):
+        """Nilai counter per jam untuk satu hari (float64, presisi penuh untuk selisih)"""
+        day_start, day_end = _day_bounds(day, tz)
+        levels = hourly_levels([day_entries], day_start, day_end)
+        if levels is None or levels.empty:
+            return None
+
+        # Hari yang sudah lewat dilengkapi sampai jam 23:00 supaya sambungan antar hari benar
+        if day_end.timestamp() < time.time():
+            full_day = pd.date_range(levels.index[0].normalize(), periods=24, freq='h')
+            levels = levels.reindex(full_day, method='ffill')
+        return EnergySeries.from_frame(levels[["value"]], np.float64)
@@ -0,0 +1,95 @@
+import numpy as np
+
+from energy_series import EnergySeries
+
+# Counter dianggap reset kalau turun lebih dari 10% (aturan yang sama dengan statistik HA)
+RESET_RATIO = 0.9
+
+# Urutan kolom hasil; kolom yang counter sumbernya tidak ada tidak ikut dibuat
+BALANCE_COLUMNS = (
+    "solar", "consumed_solar", "grid_import", "grid_export", "battery_discharge", "battery_charge", "load",
+)
+
+# Role counter yang dibutuhkan tiap kolom
+COLUMN_ROLES = {
+    "solar": ("import_plts",),
+    "consumed_solar": ("import_plts",),
+    "grid_import": ("import_pln",),
+    "grid_export": ("export_pln",),
+    "battery_discharge": ("energy_from_battery", "energy_to_battery"),
+    "battery_charge": ("energy_from_battery", "energy_to_battery"),
+    "load": ("import_plts", "import_pln"),
+}
+
+
+def _level_matrix(levels_by_role):
+    """Matriks level counter (jam x role) di atas satu index hourly bersama, jam kosong di-ffill"""
+    first_hour = min(levels.hours[0] for levels in levels_by_role.values())
+    last_hour = max(levels.hours[-1] for levels in levels_by_role.values())
+    hours = np.arange(first_hour, last_hour + 1, dtype=np.int64)
+    matrix = np.full((len(hours), len(levels_by_role)), np.nan)
+    for column, levels in enumerate(levels_by_role.values()):
+        matrix[levels.hours - first_hour, column] = levels.values[:, 0]
+
+    # Forward-fill per kolom: tiap baris memakai baris terakhir yang ada nilainya
+    source_rows = np.where(np.isnan(matrix), 0, np.arange(len(hours))[:, None])
+    np.maximum.accumulate(source_rows, axis=0, out=source_rows)
+    return hours, np.take_along_axis(matrix, source_rows, axis=0)
+
+
+def counter_deltas(matrix):
+    """Selisih per jam dari level counter; setelah reset dipakai nilai barunya, jam tanpa data jadi 0"""
+    previous, current = matrix[:-1], matrix[1:]
+    deltas = current - previous
+    reset = current < previous * RESET_RATIO
+    deltas[reset] = current[reset]
+    # Penurunan kecil (noise sensor) bukan energi negatif
+    np.clip(deltas, 0, None, out=deltas)
+    return np.nan_to_num(deltas, copy=False)
+
+
+def energy_balance(levels_by_role):
+    """Semua series energi satu site (kWh per jam) dalam satu EnergySeries, dihitung sekali dari level counter per role"""
+    levels_by_role = {
+        role: levels for role, levels in levels_by_role.items() if levels is not None and len(levels)
+    }
+    if not levels_by_role:
+        return None
+
+    hours, matrix = _level_matrix(levels_by_role)
+    if len(hours) < 2:
+        return None
+    deltas = dict(zip(levels_by_role, counter_deltas(matrix).T))
+
+    columns = [
+        name for name in BALANCE_COLUMNS if all(role in deltas for role in COLUMN_ROLES[name])
+    ]
+    if not columns:
+        return None
+    values = np.empty((len(hours) - 1, len(columns)), dtype=np.float32)
+    out = dict(zip(columns, values.T))
+
+    if "grid_export" in out:
+        out["grid_export"][:] = deltas["export_pln"]
+    if "solar" in out:
+        out["solar"][:] = deltas["import_plts"]
+        if "grid_export" in out:
+            np.subtract(deltas["import_plts"], deltas["export_pln"], out=out["consumed_solar"])
+            np.clip(out["consumed_solar"], 0, None, out=out["consumed_solar"])
+        else:
+            # Tanpa counter export, semua produksi dianggap dipakai sendiri
+            out["consumed_solar"][:] = deltas["import_plts"]
+    if "grid_import" in out:
+        out["grid_import"][:] = deltas["import_pln"]
+    if "battery_discharge" in out:
+        out["battery_discharge"][:] = deltas["energy_from_battery"]
+        out["battery_charge"][:] = deltas["energy_to_battery"]
+    if "load" in out:
+        # Beban total = solar yang dipakai + import PLN + keluar baterai - masuk baterai
+        np.add(out["consumed_solar"], out["grid_import"], out=out["load"])
+        if "battery_discharge" in out:
+            out["load"] += out["battery_discharge"]
+            out["load"] -= out["battery_charge"]
+            np.clip(out["load"], 0, None, out=out["load"])
+
+    return EnergySeries(hours[1:], values, columns)
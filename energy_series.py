@@ -0,0 +1,86 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+NS_PER_HOUR = 3_600_000_000_000
+# Offset WIB (UTC+7) dalam jam; Asia/Jakarta tidak punya DST sehingga cukup satu offset tetap
+LOCAL_OFFSET_HOURS = 7
+# Timezone lokal untuk datetime (semua modul import dari sini) dan nama tz-nya untuk pandas
+LOCAL_TZ = datetime.timezone(datetime.timedelta(hours=LOCAL_OFFSET_HOURS))  # WIB = UTC+7
+LOCAL_TZ_NAME = "Asia/Jakarta"
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+class EnergySeries:
+    """Series per jam yang ringkas untuk layer proses dan cache.
+
+    Index int64 epoch-hour (UTC) dan nilai 2D (jam x kolom), keduanya read-only sehingga
+    aman dipakai bersama oleh semua session. Nilai energi disimpan float32; level counter
+    memakai float64 karena selisih antar jam butuh presisi penuh.
+    """
+
+    __slots__ = ("hours", "values", "columns")
+
+    def __init__(self, hours, values, columns, dtype=np.float32):
+        self.hours = _read_only(np.asarray(hours, dtype=np.int64))
+        self.columns = tuple(columns)
+        values = np.asarray(values, dtype=dtype)
+        # Bentuk eksplisit: reshape(n, -1) gagal untuk 0 baris
+        self.values = _read_only(values.reshape(len(self.hours), len(self.columns)))
+
+    @classmethod
+    def from_frame(cls, df, dtype=np.float32):
+        """Dari frame/series pandas dengan DatetimeIndex tz-aware per jam (satu kali konversi)"""
+        if isinstance(df, pd.Series):
+            df = df.to_frame()
+        hours = df.index.as_unit("ns").asi8 // NS_PER_HOUR
+        return cls(hours, df.to_numpy(dtype=dtype), df.columns, dtype)
+
+    def __len__(self):
+        return len(self.hours)
+
+    @property
+    def empty(self):
+        return len(self.hours) == 0
+
+    @property
+    def nbytes(self):
+        return self.hours.nbytes + self.values.nbytes
+
+    def column(self, name):
+        """View nilai satu kolom (tanpa copy)"""
+        return self.values[:, self.columns.index(name)]
+
+    def between(self, first_hour, last_hour):
+        """Slice (view) untuk jam first_hour..last_hour inklusif; index sudah urut"""
+        start = np.searchsorted(self.hours, first_hour, side="left")
+        stop = np.searchsorted(self.hours, last_hour, side="right")
+        return EnergySeries(self.hours[start:stop], self.values[start:stop], self.columns, self.values.dtype)
+
+    @classmethod
+    def concat(cls, parts):
+        """Gabungkan beberapa series berurutan dengan kolom yang sama"""
+        parts = [part for part in parts if part is not None and not part.empty]
+        if not parts:
+            return None
+        return cls(
+            np.concatenate([part.hours for part in parts]),
+            np.concatenate([part.values for part in parts]),
+            parts[0].columns,
+            parts[0].values.dtype,
+        )
+
+    def local_index(self, aware=False):
+        """DatetimeIndex waktu lokal; default naive (siap untuk plotly tanpa konversi timezone lagi)"""
+        local_ns = (self.hours + LOCAL_OFFSET_HOURS) * NS_PER_HOUR
+        index = pd.DatetimeIndex(local_ns.view("M8[ns]"), name="timestamp")
+        return index.tz_localize(LOCAL_TZ_NAME) if aware else index
+
+    def to_frame(self, aware=False):
+        """Frame pandas yang berbagi memori nilai dengan series ini (read-only, tanpa copy)"""
+        return pd.DataFrame(self.values, index=self.local_index(aware), columns=list(self.columns), copy=False)
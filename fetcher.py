@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from dataclasses import dataclass
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Batas thread total dan batas request paralel per instance HA
+MAX_WORKERS = 16
+PER_INSTANCE_LIMIT = 3
+# Default batas waktu tunggu (detik) fetch satu site per render
+DEADLINE = 8
+
+# Dipakai bersama semua session di proses ini: request identik yang sedang jalan tidak diulang
+_inflight = SingleFlight()
+
+
+@dataclass(frozen=True)
+class FetchRequest:
+    """Satu request history untuk (instance, entity, range)"""
+    instance: str
+    entity_id: str
+    start: object
+    end: object
+
+
+def fetch_all(ha_apis, plan, store=None, cache=None, max_workers=MAX_WORKERS, per_instance_limit=PER_INSTANCE_LIMIT,
+              deadlines=None):
+    """Jalankan semua request secara paralel, hasil dikelompokkan per instance dan entity
+
+    Kalau `store` (HistoryStore) diberikan, data dibaca dari store dan HA hanya ditanya gap-nya.
+    Kalau `cache` (DayCache) diberikan, hari yang sudah ada di cache tidak di-fetch lagi.
+    `deadlines` (instance -> detik) membatasi waktu tunggu per site: site yang lewat deadline,
+    circuit breaker-nya terbuka atau worker-nya error diisi data terakhir di cache (termasuk yang
+    sudah basi) sementara fetch-nya tetap jalan di background. Return (results, set instance yang basi).
+    """
+    if not plan:
+        return {}, set()
+
+    limits = {
+        instance: threading.BoundedSemaphore(per_instance_limit)
+        for instance in {request.instance for request in plan}
+    }
+    # Supaya st.warning / st.error dari worker tetap tampil di halaman
+    ctx = get_script_run_ctx()
+
+    def attach_ctx():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+    # Satu request bulk per (instance, range), semua entity digabung
+    batches = {}
+    for request in plan:
+        batches.setdefault((request.instance, request.start, request.end), []).append(request.entity_id)
+
+    def run(instance, start, end, entity_ids):
+        ha_api = ha_apis[instance]
+
+        def fetch_bulk(fetch_start, fetch_end, fetch_entity_ids, on_chunk=None):
+            key = (instance, fetch_start, fetch_end, tuple(fetch_entity_ids))
+            # on_chunk milik pemanggil pertama; pemanggil lain menunggu hasil gabungannya
+            if store is not None:
+                return _inflight.do(
+                    key, store.get_pv_statistics_bulk, ha_api, fetch_start, fetch_end, fetch_entity_ids, on_chunk=on_chunk
+                )
+            return _inflight.do(
+                key, ha_api.get_pv_statistics_bulk, fetch_start, fetch_end, fetch_entity_ids, on_chunk=on_chunk
+            )
+
+        with limits[instance]:
+            if cache is not None:
+                return cache.get_pv_statistics_bulk(fetch_bulk, instance, start, end, entity_ids)
+            return fetch_bulk(start, end, entity_ids)
+
+    results = {}
+    stale = set()
+    started = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(batches)), initializer=attach_ctx)
+    try:
+        futures = {
+            (instance, start, end): pool.submit(run, instance, start, end, entity_ids)
+            for (instance, start, end), entity_ids in batches.items()
+        }
+        for (instance, start, end), future in futures.items():
+            deadline = (deadlines or {}).get(instance)
+            timeout = None if deadline is None else max(0.0, started + deadline - time.monotonic())
+            try:
+                batch_results = future.result(timeout=timeout)
+            except TimeoutError:
+                batch_results = None
+            except Exception as e:
+                # Error apa pun dari worker (misal callback cache) = site basi, halaman tetap dirender
+                logger.warning("Fetch %s gagal: %s", instance, e)
+                batch_results = None
+            if batch_results is None or not ha_apis[instance].breaker.healthy:
+                stale.add(instance)
+                if cache is not None:
+                    entity_ids = batches[(instance, start, end)]
+                    batch_results = cache.get_pv_statistics_bulk(None, instance, start, end, entity_ids, stale_ok=True)
+            results.setdefault(instance, {}).update(batch_results or {})
+    finally:
+        # Fetch yang lewat deadline tidak ditunggu: tetap jalan di background dan mengisi cache untuk rerun berikutnya
+        pool.shutdown(wait=False)
+    return results, stale
@@ -0,0 +1,66 @@
+import pandas as pd
+
+from energy_balance import BALANCE_COLUMNS
+
+
+class FleetView:
+    """Energy balance semua site dalam satu frame lebar: index waktu, kolom (site, series)"""
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    @classmethod
+    def build(cls, balances):
+        """Gabungkan hasil load_balances (EnergySeries per site) sekali menjadi satu frame"""
+        balances = {instance: balance.to_frame() for instance, balance in balances.items() if balance is not None}
+        if not balances:
+            empty_columns = pd.MultiIndex.from_tuples([], names=["site", "series"])
+            return cls(pd.DataFrame(columns=empty_columns, dtype=float))
+        frame = pd.concat(balances, axis=1, names=["site", "series"]).sort_index()
+        return cls(frame)
+
+    @property
+    def empty(self):
+        return self.frame.columns.empty
+
+    def sites(self):
+        return list(self.frame.columns.unique(level="site"))
+
+    def site_frame(self, instance):
+        """Slice frame fleet untuk satu site (None kalau site tidak punya data)"""
+        if instance not in self.frame.columns.get_level_values("site"):
+            return None
+        site_frame = self.frame[instance]
+        # Jam di luar range site ini bernilai NaN setelah digabung dengan site lain
+        if site_frame.isna().to_numpy().any():
+            site_frame = site_frame.dropna(how="all")
+        return site_frame
+
+    def fleet_totals(self):
+        """Total seluruh site per waktu untuk tiap series"""
+        return self.frame.T.groupby(level="series").sum().T.reindex(columns=BALANCE_COLUMNS)
+
+    def site_totals(self):
+        """Total energi per site (baris) dan series (kolom) selama range yang dipilih"""
+        return self.frame.sum().unstack("series").reindex(columns=BALANCE_COLUMNS)
+
+    def summary(self):
+        """Ranking site berdasarkan produksi PV beserta rasio self-consumption dan share export"""
+        totals = self.site_totals()
+        production = totals["solar"]
+        export = totals["grid_export"].fillna(0)
+
+        summary = pd.DataFrame({
+            "pv_kwh": production,
+            "consumed_solar_kwh": totals["consumed_solar"],
+            "import_pln_kwh": totals["grid_import"],
+            "export_pln_kwh": export,
+            "load_kwh": totals["load"],
+            # Bagian produksi PV yang dipakai sendiri (tidak diekspor)
+            "self_consumption": totals["consumed_solar"] / production.where(production > 0),
+            # Bagian site ini dari total export seluruh fleet
+            "export_share": export / export.sum() if export.sum() > 0 else 0.0,
+        })
+        summary = summary.sort_values("pv_kwh", ascending=False)
+        summary.insert(0, "rank", range(1, len(summary) + 1))
+        return summary.rename_axis("site").reset_index()
@@ -0,0 +1,184 @@
+import datetime
+import sqlite3
+import threading
+import time
+
+DEFAULT_DB_PATH = "history_store.sqlite3"
+# Data beberapa detik terakhir belum tentu sudah di-commit recorder HA
+RECORDER_LAG_SECONDS = 60
+
+
+def _to_ts(value):
+    """Konversi datetime / string ISO ke epoch detik"""
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _to_iso(ts):
+    return datetime.datetime.fromtimestamp(ts, tz=datetime.timezone.utc).isoformat()
+
+
+class HistoryStore:
+    """Penyimpanan lokal (SQLite) untuk histori state entity, diisi incremental dari HA"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS states (
+                    instance TEXT NOT NULL,
+                    entity_id TEXT NOT NULL,
+                    ts REAL NOT NULL,
+                    state TEXT,
+                    PRIMARY KEY (instance, entity_id, ts)
+                ) WITHOUT ROWID"""
+            )
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS coverage (
+                    instance TEXT NOT NULL,
+                    entity_id TEXT NOT NULL,
+                    start_ts REAL NOT NULL,
+                    end_ts REAL NOT NULL
+                )"""
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS coverage_key ON coverage (instance, entity_id)"
+            )
+
+    def get_pv_statistics_bulk(self, ha_api, start_datetime, end_datetime, entity_ids, on_chunk=None):
+        """Sama seperti HomeAssistantAPI.get_pv_statistics_bulk, tapi HA hanya ditanya bagian yang belum ada
+
+        Return None kalau ada gap yang gagal di-fetch (isi store saja tidak lengkap untuk range ini);
+        chunk yang berhasil tetap disimpan dan diteruskan ke `on_chunk`.
+        """
+        entity_ids = [entity_id for entity_id in dict.fromkeys(entity_ids) if entity_id]
+        instance = ha_api.instance
+        start_ts = _to_ts(start_datetime)
+        end_ts = _to_ts(end_datetime)
+
+        # Kelompokkan entity dengan gap yang sama supaya tetap satu request bulk per gap
+        gaps_by_entity = {
+            entity_id: self._missing_ranges(instance, entity_id, start_ts, end_ts)
+            for entity_id in entity_ids
+        }
+        entities_by_gap = {}
+        for entity_id, gaps in gaps_by_entity.items():
+            for gap in gaps:
+                entities_by_gap.setdefault(gap, []).append(entity_id)
+
+        def save_chunk(chunk_start, chunk_end, data):
+            # Tiap chunk disimpan begitu selesai, chunk yang gagal tetap jadi gap untuk request berikutnya
+            for entity_id, series in data.items():
+                if series is not None:
+                    self._save(instance, entity_id, series[0], _to_ts(chunk_start), _to_ts(chunk_end))
+            if on_chunk is not None:
+                on_chunk(chunk_start, chunk_end, data)
+
+        tz = start_datetime.tzinfo
+        failed = False
+        for (gap_start, gap_end), gap_entities in entities_by_gap.items():
+            data = ha_api.get_pv_statistics_bulk(
+                datetime.datetime.fromtimestamp(gap_start, tz=tz),
+                datetime.datetime.fromtimestamp(gap_end, tz=tz),
+                gap_entities,
+                on_chunk=save_chunk,
+            )
+            failed = failed or data is None
+        if failed:
+            return None
+
+        return {
+            entity_id: self._load(instance, entity_id, start_ts, end_ts)
+            for entity_id in entity_ids
+        }
+
+    def _missing_ranges(self, instance, entity_id, start_ts, end_ts):
+        """Bagian dari [start_ts, end_ts] yang belum tersimpan di store"""
+        with self.lock:
+            covered = self.conn.execute(
+                """SELECT start_ts, end_ts FROM coverage
+                WHERE instance = ? AND entity_id = ? AND end_ts >= ? AND start_ts <= ?
+                ORDER BY start_ts""",
+                (instance, entity_id, start_ts, end_ts),
+            ).fetchall()
+
+        gaps = []
+        cursor = start_ts
+        for covered_start, covered_end in covered:
+            if covered_start > cursor:
+                gaps.append((cursor, covered_start))
+            cursor = max(cursor, covered_end)
+        if cursor < end_ts:
+            gaps.append((cursor, end_ts))
+        return gaps
+
+    def _save(self, instance, entity_id, entries, gap_start, gap_end):
+        """Simpan state hasil fetch dan tandai range-nya sudah tersimpan"""
+        rows = []
+        for entry in entries:
+            timestamp = entry.get("last_updated") or entry.get("last_changed")
+            if timestamp:
+                rows.append((instance, entity_id, _to_ts(timestamp), entry.get("state")))
+
+        # Data terbaru belum tentu final, jadi coverage berhenti sebelum "sekarang"
+        covered_end = min(gap_end, time.time() - RECORDER_LAG_SECONDS)
+
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO states VALUES (?, ?, ?, ?)", rows)
+            if covered_end <= gap_start:
+                return
+
+            intervals = self.conn.execute(
+                "SELECT start_ts, end_ts FROM coverage WHERE instance = ? AND entity_id = ?",
+                (instance, entity_id),
+            ).fetchall()
+            intervals.append((gap_start, covered_end))
+            intervals.sort()
+
+            merged = [list(intervals[0])]
+            for interval_start, interval_end in intervals[1:]:
+                if interval_start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], interval_end)
+                else:
+                    merged.append([interval_start, interval_end])
+
+            self.conn.execute(
+                "DELETE FROM coverage WHERE instance = ? AND entity_id = ?",
+                (instance, entity_id),
+            )
+            self.conn.executemany(
+                "INSERT INTO coverage VALUES (?, ?, ?, ?)",
+                [(instance, entity_id, merged_start, merged_end) for merged_start, merged_end in merged],
+            )
+
+    def _load(self, instance, entity_id, start_ts, end_ts):
+        """Baca histori dari store dalam format response /api/history/period"""
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT ts, state FROM states
+                WHERE instance = ? AND entity_id = ? AND ts >= ? AND ts <= ?
+                ORDER BY ts""",
+                (instance, entity_id, start_ts, end_ts),
+            ).fetchall()
+            previous = self.conn.execute(
+                """SELECT ts, state FROM states
+                WHERE instance = ? AND entity_id = ? AND ts < ?
+                ORDER BY ts DESC LIMIT 1""",
+                (instance, entity_id, start_ts),
+            ).fetchone()
+
+        # Seperti HA: state yang berlaku saat start ikut dikirim dengan timestamp = start
+        if previous is not None and (not rows or rows[0][0] > start_ts):
+            rows.insert(0, (start_ts, previous[1]))
+
+        if not rows:
+            return None
+
+        entries = [
+            {"entity_id": entity_id, "state": state, "last_changed": _to_iso(ts), "last_updated": _to_iso(ts)}
+            for ts, state in rows
+        ]
+        return [entries]
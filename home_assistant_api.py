@@ -1,11 +1,63 @@
 import requests
-import streamlit as st
+import notify
 import datetime
+import json
+import threading
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from websockets.sync.client import connect as ws_connect
+from circuit_breaker import FAILURE_THRESHOLD, RESET_TIMEOUT, CircuitBreaker
+from metrics import metrics
+
+# Default timeout (detik) dan retry untuk koneksi ke site HA
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+POOL_SIZE = 8
+# Range panjang dipecah per chunk hari lokal; ukuran chunk (1-7 hari) diatur dari ukuran response
+TARGET_CHUNK_BYTES = 4_000_000
+MAX_CHUNK_DAYS = 7
+# Perkiraan awal ukuran response per entity per hari sebelum ada response yang teramati
+DEFAULT_BYTES_PER_ENTITY_DAY = 250_000
+# Request chunk paralel per instance HA dan jumlah retry untuk chunk yang gagal
+CHUNK_CONCURRENCY = 3
+CHUNK_RETRIES = 2
+
+
+def _entry_time(entry):
+    return datetime.datetime.fromisoformat(entry.get("last_updated") or entry.get("last_changed"))
+
+
+def _stitch(chunk_results, entity_ids):
+    """Sambung hasil chunk berurutan per entity; state awal chunk yang sudah ada di chunk sebelumnya dibuang"""
+    stitched = {entity_id: [] for entity_id in entity_ids}
+    for results in chunk_results:
+        for entity_id, series in results.items():
+            if not series:
+                continue
+            entries = series[0]
+            merged = stitched[entity_id]
+            if merged:
+                last = _entry_time(merged[-1])
+                skip = 0
+                while skip < len(entries) and _entry_time(entries[skip]) <= last:
+                    skip += 1
+                entries = entries[skip:]
+            merged.extend(entries)
+    return {entity_id: [entries] if entries else None for entity_id, entries in stitched.items()}
 
 class HomeAssistantAPI:
-    def __init__(self, instance):
-        ha_config = st.secrets[instance]
+    def __init__(self, instance, secrets_key=None, config=None):
+        # Config bisa diberikan langsung (benchmark / CLI), default dari st.secrets
+        if config is None:
+            import streamlit as st
+            config = st.secrets[secrets_key or instance]
+        ha_config = config
+        self.instance = instance
         self.url = ha_config["url"].rstrip('/')
         self.token = ha_config["token"]
         # Pastikan token tidak include 'Bearer' prefix
@@ -14,64 +66,271 @@ class HomeAssistantAPI:
         
         self.headers = {
             "Authorization": f"Bearer {self.token}",  # Tambahkan 'Bearer ' prefix
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate",
         }
 
+        self.timeout = (
+            float(ha_config.get("connect_timeout", CONNECT_TIMEOUT)),
+            float(ha_config.get("read_timeout", READ_TIMEOUT)),
+        )
+        self.session = self._create_session(
+            int(ha_config.get("max_retries", MAX_RETRIES)),
+            float(ha_config.get("backoff_factor", BACKOFF_FACTOR)),
+        )
+
+        self.target_chunk_bytes = int(ha_config.get("chunk_target_bytes", TARGET_CHUNK_BYTES))
+        self.chunk_retries = int(ha_config.get("chunk_retries", CHUNK_RETRIES))
+        self.chunk_concurrency = int(ha_config.get("chunk_concurrency", CHUNK_CONCURRENCY))
+        # Batas request chunk paralel dipakai bersama semua pemanggil instance ini
+        self.chunk_limit = threading.BoundedSemaphore(self.chunk_concurrency)
+        self.size_lock = threading.Lock()
+        self.bytes_per_entity_day = DEFAULT_BYTES_PER_ENTITY_DAY
+
+        # Site yang gagal terus tidak dipanggil lagi sampai reset_timeout lewat (lihat CircuitBreaker)
+        self.breaker = CircuitBreaker(
+            int(ha_config.get("failure_threshold", FAILURE_THRESHOLD)),
+            float(ha_config.get("reset_timeout", RESET_TIMEOUT)),
+        )
+
+    def _create_session(self, max_retries, backoff_factor):
+        """Session keep-alive dengan connection pool dan retry untuk 5xx / error koneksi"""
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self.headers)
+        return session
+
     def get_data(self):
         """Ambil semua data dari Home Assistant"""
         base_url = self.url.rstrip('/api').rstrip('/')
-        response = requests.get(f"{base_url}/api/states", headers=self.headers)
-        return response.json() if response.status_code == 200 else None
+        with metrics.timer("http", self.instance, "/api/states") as fields:
+            response = self.session.get(f"{base_url}/api/states", timeout=self.timeout)
+            fields["bytes"] = len(response.content)
+        if response.status_code != 200:
+            return None
+        with metrics.timer("json_decode", self.instance, "/api/states") as fields:
+            data = response.json()
+            fields["rows"] = len(data)
+        return data
 
-    def get_pv_statistics(self, start_datetime, end_datetime, entity_id="sensor.pv_energy_daily"):
+    def get_statistics(self, start_datetime, end_datetime, statistic_ids, period="hour"):
+        """Ambil long-term statistics (perubahan energi per hour/day/week/month) lewat websocket recorder
+
+        Return dict statistic_id -> list row HA ({"start", "end", "change"}, waktu dalam epoch ms).
+        """
+        try:
+            return self._ws_command({
+                "type": "recorder/statistics_during_period",
+                "start_time": start_datetime.isoformat(),
+                "end_time": end_datetime.isoformat(),
+                "statistic_ids": list(statistic_ids),
+                "period": period,
+                "types": ["change"],
+            })
+        except Exception as e:
+            notify.error(f"⚠️ Error saat mengambil statistics: {str(e)}")
+            return None
+
+    @contextmanager
+    def open_websocket(self):
+        """Koneksi websocket ke /api/websocket yang sudah terautentikasi"""
+        base_url = self.url.rstrip('/api').rstrip('/')
+        ws_url = base_url.replace("https://", "wss://", 1).replace("http://", "ws://", 1) + "/api/websocket"
+        connect_timeout, read_timeout = self.timeout
+
+        with ws_connect(ws_url, open_timeout=connect_timeout, max_size=None) as ws:
+            message = json.loads(ws.recv(timeout=read_timeout))
+            if message.get("type") == "auth_required":
+                ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+                message = json.loads(ws.recv(timeout=read_timeout))
+            if message.get("type") != "auth_ok":
+                raise RuntimeError(f"Autentikasi websocket gagal: {message.get('message', message.get('type'))}")
+            yield ws
+
+    def _ws_command(self, command):
+        """Buka koneksi websocket, kirim satu command dan kembalikan result-nya"""
+        _, read_timeout = self.timeout
+        with self.open_websocket() as ws:
+            ws.send(json.dumps({"id": 1, **command}))
+            while True:
+                message = json.loads(ws.recv(timeout=read_timeout))
+                if message.get("id") == 1 and message.get("type") == "result":
+                    break
+
+        if not message.get("success"):
+            error = message.get("error", {})
+            raise RuntimeError(f"{error.get('code')}: {error.get('message')}")
+        return message["result"]
+
+    def get_pv_statistics(self, start_datetime, end_datetime, entity_id="sensor.pv_energy_daily", lean=True):
         """Ambil data histori produksi PV energy berdasarkan range tanggal"""
+        return self._get_history(start_datetime, end_datetime, entity_id, lean)
+
+    def get_pv_statistics_bulk(self, start_datetime, end_datetime, entity_ids, lean=True, on_chunk=None):
+        """Ambil histori beberapa entity sekaligus, dipisah lagi per entity
+
+        Range panjang dipecah menjadi chunk hari lokal yang di-fetch paralel; hanya chunk yang gagal
+        yang diulang. `on_chunk(chunk_start, chunk_end, results)` dipanggil untuk tiap chunk yang
+        berhasil (format results sama dengan return value) supaya bisa di-cache sendiri-sendiri.
+        Return None kalau masih ada chunk yang gagal setelah retry, atau kalau circuit breaker site
+        ini sedang terbuka (request tidak dikirim sama sekali).
+        """
+        entity_ids = [entity_id for entity_id in dict.fromkeys(entity_ids) if entity_id]
+        if not entity_ids:
+            return {}
+        if not self.breaker.allow():
+            return None
+
+        # Hasil selalu dicatat ke breaker (juga kalau on_chunk raise), supaya probe half-open tidak menggantung
+        succeeded = False
         try:
-            # Format timestamp dengan format yang benar untuk URL
-            start_timestamp = start_datetime.isoformat()
-            end_timestamp = end_datetime.isoformat()
-            
-            # URL yang benar sesuai dokumentasi
-            base_url = self.url.rstrip('/api').rstrip('/')
-            
-            # Encode timestamp untuk URL
-            encoded_start = urllib.parse.quote(start_timestamp)
-            encoded_end = urllib.parse.quote(end_timestamp)
-            
-            api_url = f"{base_url}/api/history/period/{encoded_start}"
-            
-            params = {
-                "filter_entity_id": entity_id,
-                "end_time": end_timestamp,
-                "minimal_response": "false",
-                "significant_changes_only": "false"
-            }
-            
-            # # Debug: Print timestamps, API URL, and parameters
-            # st.write(f"Debug - Start Timestamp: {start_timestamp}")
-            # st.write(f"Debug - End Timestamp: {end_timestamp}")
-            # st.write(f"Debug - API URL: {api_url}")
-            # st.write(f"Debug - Parameters: {params}")
-            
-            response = requests.get(api_url, headers=self.headers, params=params)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # # Debug: Print JSON output
-                # st.write("Debug - JSON Output:", data)
-                
-                if not data or len(data) == 0:
-                    st.warning("⚠️ Tidak ada data PV yang ditemukan untuk periode tersebut")
-                    return None
-                
-                return data
+            chunks = self._plan_chunks(start_datetime, end_datetime, len(entity_ids))
+            chunk_results = {}
+            errors = {}
+            pending = chunks
+            for _ in range(self.chunk_retries + 1):
+                if not pending:
+                    break
+                with ThreadPoolExecutor(max_workers=min(self.chunk_concurrency, len(pending))) as pool:
+                    futures = {
+                        chunk: pool.submit(self._fetch_chunk, chunk, entity_ids, lean) for chunk in pending
+                    }
+                failed = []
+                for chunk, future in futures.items():
+                    try:
+                        chunk_results[chunk] = future.result()
+                    except Exception as e:
+                        errors[chunk] = e
+                        failed.append(chunk)
+                        continue
+                    errors.pop(chunk, None)
+                    if on_chunk is not None:
+                        on_chunk(chunk[0], chunk[1], chunk_results[chunk])
+                pending = failed
+
+            if pending:
+                for chunk_start, chunk_end in pending:
+                    notify.error(
+                        f"⚠️ Gagal mengambil data PV {chunk_start:%Y-%m-%d %H:%M} s/d {chunk_end:%Y-%m-%d %H:%M}: "
+                        f"{errors[(chunk_start, chunk_end)]}"
+                    )
+                return None
+            succeeded = True
+        finally:
+            if succeeded:
+                self.breaker.record_success()
             else:
-                st.error(f"⚠️ Gagal mengambil data PV: {response.status_code}")
-                st.error(f"Response: {response.text}")
+                self.breaker.record_failure()
+        stitched = _stitch((chunk_results[chunk] for chunk in chunks), entity_ids)
+        # Hasil per chunk selalu berisi key semua entity, jadi yang dicek hasil per entity
+        if not any(stitched.values()):
+            notify.warning("⚠️ Tidak ada data PV yang ditemukan untuk periode tersebut")
+        return stitched
+
+    def _plan_chunks(self, start_datetime, end_datetime, entity_count):
+        """Pecah range di batas tengah malam lokal; jumlah hari per chunk dari perkiraan ukuran response"""
+        with self.size_lock:
+            bytes_per_day = self.bytes_per_entity_day * entity_count
+        chunk_days = max(1, min(MAX_CHUNK_DAYS, int(self.target_chunk_bytes // max(bytes_per_day, 1))))
+
+        chunks = []
+        chunk_start = start_datetime
+        while chunk_start < end_datetime:
+            next_midnight = datetime.datetime.combine(
+                chunk_start.date() + datetime.timedelta(days=chunk_days), datetime.time(0, 0), tzinfo=start_datetime.tzinfo
+            )
+            chunk_end = min(next_midnight, end_datetime)
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end
+        return chunks or [(start_datetime, end_datetime)]
+
+    def _fetch_chunk(self, chunk, entity_ids, lean):
+        """Satu request history untuk satu chunk; exception dibiarkan naik supaya chunk bisa di-retry"""
+        chunk_start, chunk_end = chunk
+        with self.chunk_limit:
+            data, size = self._request_history(chunk_start, chunk_end, ",".join(entity_ids), lean)
+        self._observe_size(size, len(entity_ids), chunk_end - chunk_start)
+
+        results = {entity_id: None for entity_id in entity_ids}
+        for series in data or []:
+            if series and series[0].get("entity_id") in results:
+                # Bungkus jadi list supaya formatnya sama dengan get_pv_statistics
+                results[series[0]["entity_id"]] = [series]
+        return results
+
+    def _observe_size(self, size, entity_count, span):
+        """Perbarui perkiraan byte per entity per hari (rata-rata bergerak) dari response yang masuk"""
+        # Chunk pendek (misal hari ini) dihitung minimal satu jam supaya perkiraan tidak melonjak
+        span_days = max(span.total_seconds(), 3600) / 86400
+        observed = size / (entity_count * span_days)
+        with self.size_lock:
+            self.bytes_per_entity_day = 0.5 * self.bytes_per_entity_day + 0.5 * observed
+
+    def _get_history(self, start_datetime, end_datetime, filter_entity_id, lean=True):
+        """Request ke /api/history/period untuk satu atau beberapa entity (dipisah koma), error ditampilkan"""
+        try:
+            data, _ = self._request_history(start_datetime, end_datetime, filter_entity_id, lean)
+            if not data:
+                notify.warning("⚠️ Tidak ada data PV yang ditemukan untuk periode tersebut")
                 return None
-            
+            return data
+
         except Exception as e:
-            st.error(f"⚠️ Error saat mengambil data PV: {str(e)}")
+            notify.error(f"⚠️ Error saat mengambil data PV: {str(e)}")
             import traceback
-            st.error(traceback.format_exc())
-            return None
\ No newline at end of file
+            notify.error(traceback.format_exc())
+            return None
+
+    def _request_history(self, start_datetime, end_datetime, filter_entity_id, lean=True):
+        """Request ke /api/history/period, return (data, ukuran response dalam byte); gagal = exception
+
+        Mode `lean` minta response sekecil mungkin (tanpa attributes/context, hanya state dan
+        last_changed). Cukup untuk counter energi karena parser hanya butuh state dan timestamp.
+        """
+        # Format timestamp dengan format yang benar untuk URL
+        start_timestamp = start_datetime.isoformat()
+        end_timestamp = end_datetime.isoformat()
+
+        # URL yang benar sesuai dokumentasi
+        base_url = self.url.rstrip('/api').rstrip('/')
+
+        # Encode timestamp untuk URL
+        encoded_start = urllib.parse.quote(start_timestamp)
+        encoded_end = urllib.parse.quote(end_timestamp)
+
+        api_url = f"{base_url}/api/history/period/{encoded_start}"
+
+        # HA hanya cek ada/tidaknya key minimal_response & no_attributes (nilainya diabaikan),
+        # sedangkan significant_changes_only baru nonaktif kalau nilainya "0"
+        params = {
+            "filter_entity_id": filter_entity_id,
+            "end_time": end_timestamp,
+            "significant_changes_only": "0"
+        }
+        if lean:
+            params["minimal_response"] = ""
+            params["no_attributes"] = ""
+
+        with metrics.timer("http", self.instance, filter_entity_id) as fields:
+            response = self.session.get(api_url, params=params, timeout=self.timeout)
+            fields["bytes"] = len(response.content)
+
+        if response.status_code != 200:
+            raise RuntimeError(f"Gagal mengambil data PV: {response.status_code} {response.text[:200]}")
+
+        with metrics.timer("json_decode", self.instance, filter_entity_id) as fields:
+            data = response.json()
+            fields["rows"] = sum(len(series) for series in data or [])
+        return data, len(response.content)
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Jumlah event terakhir yang disimpan untuk panel diagnostics (p95 dsb.)
+MAX_EVENTS = 5000
+
+
+class Metrics:
+    """Metrik per stage (http, json_decode, process, figure_build, ...) per site dan entity"""
+
+    def __init__(self, max_events=MAX_EVENTS):
+        self.lock = threading.Lock()
+        self.events = deque(maxlen=max_events)
+        self.totals = {}
+        self.log_events = False
+        self.log_handler = None
+
+    def enable_logging(self, path=None):
+        """Tulis tiap event sebagai satu baris JSON ke file `path` (atau stderr); aman dipanggil tiap rerun"""
+        target = os.path.abspath(path) if path else None
+        with self.lock:
+            if self.log_handler is None or getattr(self.log_handler, "baseFilename", None) != target:
+                if self.log_handler is not None:
+                    logger.removeHandler(self.log_handler)
+                    self.log_handler.close()
+                self.log_handler = logging.FileHandler(target) if target else logging.StreamHandler()
+                self.log_handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(self.log_handler)
+                logger.setLevel(logging.INFO)
+                # Baris JSON tidak ikut format log root (kalau ada)
+                logger.propagate = False
+            self.log_events = True
+
+    @contextmanager
+    def timer(self, stage, site=None, entity=None):
+        """Ukur durasi blok; field tambahan (bytes, rows) bisa diisi lewat dict yang di-yield"""
+        fields = {}
+        start = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            self.record(stage, site, entity, time.perf_counter() - start, **fields)
+
+    def record(self, stage, site, entity, seconds, **fields):
+        event = {
+            "ts": time.time(),
+            "stage": stage,
+            "site": site or "",
+            "entity": entity or "",
+            "seconds": seconds,
+            "bytes": fields.get("bytes", 0),
+            "rows": fields.get("rows", 0),
+        }
+        key = (stage, event["site"], event["entity"])
+        with self.lock:
+            self.events.append(event)
+            total = self.totals.setdefault(key, {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "bytes": 0, "rows": 0})
+            total["count"] += 1
+            total["seconds"] += seconds
+            total["max_seconds"] = max(total["max_seconds"], seconds)
+            total["bytes"] += event["bytes"]
+            total["rows"] += event["rows"]
+        if self.log_events:
+            logger.info(json.dumps(event))
+
+    def summary(self):
+        """Ringkasan event terakhir per stage/site/entity untuk panel diagnostics"""
+        with self.lock:
+            events = list(self.events)
+        if not events:
+            return pd.DataFrame(columns=["stage", "site", "entity", "count", "mean_ms", "p95_ms", "max_ms", "bytes", "rows"])
+
+        df = pd.DataFrame(events)
+        df["ms"] = df["seconds"] * 1000
+        grouped = df.groupby(["stage", "site", "entity"])
+        return pd.DataFrame({
+            "count": grouped["ms"].count(),
+            "mean_ms": grouped["ms"].mean().round(1),
+            "p95_ms": grouped["ms"].quantile(0.95).round(1),
+            "max_ms": grouped["ms"].max().round(1),
+            "bytes": grouped["bytes"].sum(),
+            "rows": grouped["rows"].sum(),
+        }).reset_index().sort_values("max_ms", ascending=False)
+
+    def to_prometheus(self):
+        """Total kumulatif dalam format text exposition Prometheus"""
+        with self.lock:
+            totals = {key: dict(value) for key, value in self.totals.items()}
+
+        lines = [
+            "# HELP recap_stage_seconds Durasi per stage dashboard.",
+            "# TYPE recap_stage_seconds summary",
+        ]
+        for (stage, site, entity), total in sorted(totals.items()):
+            labels = f'stage="{stage}",site="{site}",entity="{entity}"'
+            lines.append(f"recap_stage_seconds_count{{{labels}}} {total['count']}")
+            lines.append(f"recap_stage_seconds_sum{{{labels}}} {total['seconds']:.6f}")
+        for name, field, help_text in [
+            ("recap_stage_max_seconds", "max_seconds", "Durasi maksimum per stage."),
+            ("recap_stage_bytes_total", "bytes", "Total bytes response per stage."),
+            ("recap_stage_rows_total", "rows", "Total baris data yang diproses per stage."),
+        ]:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {'gauge' if field == 'max_seconds' else 'counter'}")
+            for (stage, site, entity), total in sorted(totals.items()):
+                labels = f'stage="{stage}",site="{site}",entity="{entity}"'
+                lines.append(f"{name}{{{labels}}} {total[field]}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Tulis metrik ke file (untuk node_exporter textfile collector), atomik lewat file sementara"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as metrics_file:
+            metrics_file.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+# Satu instance untuk seluruh proses Streamlit
+metrics = Metrics()
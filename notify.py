@@ -0,0 +1,30 @@
+import logging
+
+logger = logging.getLogger("recap")
+
+
+def _in_streamlit():
+    """True kalau dipanggil dari script Streamlit yang sedang jalan (bukan CLI / thread background)"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return False
+    return get_script_run_ctx(suppress_warning=True) is not None
+
+
+def warning(message):
+    """st.warning di halaman, atau log warning kalau tidak ada halaman"""
+    if _in_streamlit():
+        import streamlit as st
+        st.warning(message)
+    else:
+        logger.warning(message)
+
+
+def error(message):
+    """st.error di halaman, atau log error kalau tidak ada halaman"""
+    if _in_streamlit():
+        import streamlit as st
+        st.error(message)
+    else:
+        logger.error(message)
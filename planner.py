@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+
+import notify
+from fetcher import FetchRequest
+from metrics import metrics
+
+
+@dataclass(frozen=True)
+class Panel:
+    """Deklarasi satu panel dashboard: role entity yang di-fetch dan kolom energy balance yang wajib ada"""
+    key: str
+    title: str
+    roles: tuple
+    required: tuple = ()
+
+
+@dataclass(frozen=True)
+class SeriesKey:
+    """Satu series yang diproses: (instance, entity, range, granularity)"""
+    instance: str
+    entity_id: str
+    start: object
+    end: object
+    granularity: str
+
+
+PANELS = (
+    Panel(
+        "pv_production",
+        "### 🔆 {instance} PV Production",
+        roles=("import_plts",),
+        required=("solar",),
+    ),
+    Panel(
+        "energy_usage",
+        "### ⚡ {instance} Energy Usage",
+        roles=("import_plts", "import_pln", "export_pln", "energy_from_battery", "energy_to_battery"),
+        required=("consumed_solar", "grid_import"),
+    ),
+)
+
+
+def plan_series(site_entities, panels, start_datetime, end_datetime, granularity):
+    """Petakan (instance, panel) -> {role: SeriesKey}; series yang sama dipakai bersama antar panel"""
+    plan = {}
+    for instance, entities in site_entities.items():
+        for panel in panels:
+            plan[(instance, panel.key)] = {
+                role: SeriesKey(instance, entities[role], start_datetime, end_datetime, granularity)
+                for role in panel.roles
+                if entities.get(role)
+            }
+    return plan
+
+
+def unique_series(series_plan):
+    """Semua series unik di plan, urutan sesuai kemunculan pertama"""
+    return list(dict.fromkeys(
+        series for panel_series in series_plan.values() for series in panel_series.values()
+    ))
+
+
+def fetch_requests(series_plan):
+    """Request history unik per (instance, entity, range) untuk fetch_all"""
+    return list(dict.fromkeys(
+        FetchRequest(series.instance, series.entity_id, series.start, series.end)
+        for series in unique_series(series_plan)
+    ))
+
+
+def site_series(series_plan):
+    """Series per site (role -> SeriesKey), gabungan semua panel"""
+    sites = {}
+    for (instance, _), panel_series in series_plan.items():
+        sites.setdefault(instance, {}).update(panel_series)
+    return sites
+
+
+def load_balance(day_cache, instance, role_series, granularity=None, stale_ok=False):
+    """Energy balance satu site dari DayCache, default di granularity plan"""
+    entities = {role: series.entity_id for role, series in role_series.items()}
+    series = next(iter(role_series.values()))
+    return day_cache.get_balance(
+        instance, entities, series.start, series.end, granularity or series.granularity, stale_ok
+    )
+
+
+def load_balances(series_plan, day_cache, results, stale=()):
+    """Energy balance per site, semua counter site diproses sekali dalam satu pass
+
+    Site di `stale` (lewat deadline / offline) memakai data cache terakhir walaupun sudah basi.
+    """
+    balances = {}
+    for instance, role_series in site_series(series_plan).items():
+        fetched = [
+            series.entity_id for series in role_series.values()
+            if results.get(instance, {}).get(series.entity_id)
+        ]
+        if not fetched:
+            balances[instance] = None
+            continue
+
+        with metrics.timer("process", instance) as fields:
+            balances[instance] = load_balance(day_cache, instance, role_series, stale_ok=instance in stale)
+            fields["rows"] = sum(len(results[instance][entity_id][0]) for entity_id in fetched)
+        if balances[instance] is None:
+            notify.warning(f"⚠️ {instance}: Tidak ada data valid yang dapat diproses ({', '.join(fetched)})")
+    return balances
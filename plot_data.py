@@ -0,0 +1,218 @@
+"""Proses data PV dan bangun figure plotly tanpa Streamlit (dipakai dashboard dan recap_export)"""
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from energy_series import LOCAL_TZ_NAME
+
+# Format tick dan hover sumbu x untuk granularity selain hourly
+TIME_FORMATS = {
+    "day": ("%d/%m", "%d %b %Y"),
+    "week": ("%d/%m", "Minggu %d %b %Y"),
+    "month": ("%b %Y", "%B %Y"),
+}
+
+# Batas jumlah titik per trace sebelum di-downsample, dan batas titik untuk pindah ke WebGL
+MAX_POINTS = 1500
+WEBGL_THRESHOLD = 1000
+FIGURE_CACHE_SIZE = 256
+
+_figure_cache = OrderedDict()
+_figure_cache_lock = threading.Lock()
+
+
+def hourly_levels(raw_data, requested_start, requested_end):
+    """Nilai counter di setiap awal jam (belum di-diff), None kalau tidak ada data valid"""
+    entity_data = raw_data[0]  # Ambil data sensor pertama
+
+    # Bangun frame langsung dari list JSON, semua kolom diproses sekaligus
+    records = pd.DataFrame.from_records(entity_data, columns=['state', 'last_updated', 'last_changed'])
+    timestamps = pd.to_datetime(
+        records['last_updated'].fillna(records['last_changed']),
+        utc=True, format='ISO8601', errors='coerce'
+    )
+    values = pd.to_numeric(records['state'], errors='coerce')
+
+    df = pd.DataFrame(
+        {'value': values.to_numpy()},
+        index=pd.DatetimeIndex(timestamps, name='timestamp').tz_convert(LOCAL_TZ_NAME)  # Convert to local timezone
+    )
+    df = df[df.index.notna() & df['value'].notna()]
+
+    if df.empty:
+        return None
+
+    # Sort dan remove duplicates
+    df = df.sort_index(kind='stable')
+    df = df[~df.index.duplicated(keep='first')]
+
+    # Convert requested timestamps to pandas datetime for comparison
+    req_start = pd.to_datetime(requested_start).tz_convert(LOCAL_TZ_NAME)
+    req_end = pd.to_datetime(requested_end).tz_convert(LOCAL_TZ_NAME)
+
+    # Filter data to match requested time range
+    df_filtered = df[(df.index >= req_start) & (df.index <= req_end)]
+
+    return df_filtered.resample('h').ffill()
+
+
+def process_statistics(rows):
+    """Konversi row long-term statistics HA ke DataFrame 'value' (kWh per periode, index = awal periode)"""
+    if not rows:
+        return None
+
+    records = pd.DataFrame.from_records(rows, columns=['start', 'change'])
+    index = pd.to_datetime(records['start'], unit='ms', utc=True).dt.tz_convert(LOCAL_TZ_NAME)
+    return pd.DataFrame(
+        {'value': pd.to_numeric(records['change'], errors='coerce').to_numpy()},
+        index=pd.DatetimeIndex(index, name='timestamp')
+    ).dropna()
+
+
+def time_axis(index, granularity="hour"):
+    """Format tick/hover dan range sumbu x sesuai granularity dan panjang data"""
+    if granularity != "hour":
+        tick_format, hover_format = TIME_FORMATS[granularity]
+        return tick_format, hover_format, None
+
+    date_range = (index.max() - index.min()).days if len(index) else 0
+    if date_range > 1:
+        tick_format = "%d/%m %H:%M"  # Format untuk multiple days
+    else:
+        tick_format = "%H:%M"  # Format untuk single day
+    hover_format = "%d %b %Y %H:%M"  # Format lengkap untuk hover
+    x_range = [
+        index.min().replace(hour=0, minute=0),
+        index.max().replace(hour=23, minute=59)
+    ] if len(index) else [0, 0]
+    return tick_format, hover_format, x_range
+
+
+def energy_usage_traces(df_consumed_solar, df_import_pln, df_export_pln, df_energy_from_battery=None, df_energy_to_battery=None):
+    """Trace grafik penggunaan energi (dipakai halaman dan export HTML)"""
+    traces = [
+        {"df": df_consumed_solar, "name": "Consumed Solar", "color": "rgba(255, 193, 7, 0.6)"},
+        {"df": df_import_pln, "name": "Import PLN", "color": "rgba(0, 123, 255, 0.6)"},
+        # Negative values for export
+        {"df": df_export_pln, "name": "Export PLN", "color": "rgba(123, 0, 255, 0.6)", "negative": True},
+    ]
+    if df_energy_from_battery is not None and df_energy_to_battery is not None:
+        traces.extend([
+            {"df": df_energy_from_battery, "name": "Energy from Battery", "color": "rgba(0, 255, 0, 0.6)"},
+            # Negative values for energy to battery
+            {"df": df_energy_to_battery, "name": "Energy to Battery", "color": "rgba(255, 0, 255, 0.6)", "negative": True},
+        ])
+    for trace in traces:
+        trace["hovertemplate"] = f"<b>{trace['name']}</b><br>%{{y:.2f}} kWh<extra></extra>"
+    return traces
+
+
+def solar_production_traces(df):
+    """Trace grafik produksi solar (dipakai halaman dan export HTML)"""
+    return [{
+        "df": df,
+        "name": "Solar Production",
+        "color": "rgba(255, 193, 7, 0.6)",
+        "hovertemplate": "<b>Solar Production</b><br>%{y:.2f} kWh<br>%{x|{hover_format}}<extra></extra>",
+    }]
+
+
+def build_figure(traces, granularity="hour", barmode=None, range_traces=None, max_points=MAX_POINTS):
+    """Bangun dict figure plotly (dengan downsampling & WebGL untuk data padat), pakai cache kalau ada"""
+    traces = [trace for trace in traces if trace.get("df") is not None]
+    key = _figure_fingerprint(traces, granularity, barmode, range_traces, max_points)
+    with _figure_cache_lock:
+        if key in _figure_cache:
+            _figure_cache.move_to_end(key)
+            return _figure_cache[key]
+
+    # Persiapkan data untuk plotting (EnergySeries.to_frame sudah naive waktu lokal; frame tz-aware dilepas di sini)
+    frames = [trace["df"]["value"] for trace in traces]
+    frames = [frame.tz_localize(None) if frame.index.tz is not None else frame for frame in frames]
+
+    # Tentukan format tanggal berdasarkan range data
+    range_frames = frames[:range_traces] if range_traces else frames
+    index = functools.reduce(lambda left, right: left.union(right), [frame.index for frame in range_frames], pd.DatetimeIndex([]))
+    tick_format, hover_format, x_range = time_axis(index, granularity)
+
+    dense = max((len(frame) for frame in frames), default=0) > WEBGL_THRESHOLD
+    data = []
+    for trace, values in zip(traces, frames):
+        values = downsample(values, max_points)
+        y = values.to_numpy().round(3)
+        spec = {
+            "x": values.index,
+            "y": -y if trace.get("negative") else y,
+            "name": trace.get("name"),
+            "hovertemplate": trace["hovertemplate"].replace("{hover_format}", hover_format),
+        }
+        if dense:
+            # Bar tidak punya versi WebGL, jadi data padat digambar sebagai scattergl
+            spec.update({
+                "type": "scattergl",
+                "mode": "lines",
+                "line": {"color": trace["color"], "width": 1, "shape": "hv"},
+                "fill": "tozeroy",
+            })
+        else:
+            spec.update({"type": "bar", "marker": {"color": trace["color"]}})
+        data.append(spec)
+
+    # Konfigurasi plot
+    layout = {
+        "plot_bgcolor": "#1a1a2e",
+        "paper_bgcolor": "#1a1a2e",
+        "font": {"color": "#ffffff"},
+        "xaxis": {
+            "showgrid": True,
+            "gridcolor": "#2a2a4a",
+            "title": None,
+            "tickformat": tick_format,
+            "hoverformat": hover_format,
+            "range": x_range
+        },
+        "yaxis": {
+            "showgrid": True,
+            "gridcolor": "#2a2a4a",
+            "title": "kWh",
+            "tickformat": ",.0f",
+        },
+        "margin": {"t": 5, "l": 5, "r": 5, "b": 5},
+        "height": 220,
+        "hovermode": "x unified",
+    }
+    if barmode:
+        layout["barmode"] = barmode  # relative supaya nilai negatif ditumpuk ke bawah
+    fig = {"data": data, "layout": layout}
+
+    with _figure_cache_lock:
+        _figure_cache[key] = fig
+        while len(_figure_cache) > FIGURE_CACHE_SIZE:
+            _figure_cache.popitem(last=False)
+    return fig
+
+
+def downsample(values, max_points=MAX_POINTS):
+    """Min/max bucketing: tiap bucket hanya simpan titik minimum dan maksimum"""
+    if max_points is None or len(values) <= max_points:
+        return values
+
+    buckets = np.arange(len(values)) * (max_points // 2) // len(values)
+    grouped = pd.Series(values.to_numpy()).groupby(buckets)
+    keep = np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+    return values.iloc[keep]
+
+
+def _figure_fingerprint(traces, granularity, barmode, range_traces, max_points):
+    """Hash isi data + opsi tampilan, dipakai sebagai key cache figure"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((granularity, barmode, range_traces, max_points)).encode())
+    for trace in traces:
+        options = {name: value for name, value in trace.items() if name != "df"}
+        digest.update(repr(sorted(options.items())).encode())
+        digest.update(pd.util.hash_pandas_object(trace["df"]["value"], index=True).to_numpy().tobytes())
+    return digest.hexdigest()
@@ -0,0 +1,282 @@
+"""Export recap energi semua site tanpa membuka dashboard Streamlit.
+
+Contoh (recap kemarin untuk semua site, hasil di ./recaps):
+    python recap_export.py
+    python recap_export.py --start 2024-06-01 --end 2024-06-30 --format parquet csv --workers 8
+    python recap_export.py --start 2024-01-01 --end 2024-06-30 --source statistics
+
+Exit code 1 kalau ada job yang gagal (hari yang hilang dicatat di recaps/incomplete_days.csv).
+"""
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+import tomllib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+from aggregation import build_rollups, select_granularity
+from energy_balance import BALANCE_COLUMNS, energy_balance
+from energy_series import LOCAL_TZ, EnergySeries
+from fleet import FleetView
+from home_assistant_api import HomeAssistantAPI
+import plot_data
+from site_registry import SITES_CONFIG, SiteRegistry, Site
+
+logger = logging.getLogger("recap")
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+OUTPUT_DIR = "recaps"
+# Ditulis di output kalau ada job yang gagal; fleet_summary.csv tidak ditulis selama file ini ada
+INCOMPLETE_FILE = "incomplete_days.csv"
+FLEET_SUMMARY_FILE = "fleet_summary.csv"
+# Jumlah hari per job fetch; job lebih kecil = lebih paralel, lebih banyak request
+CHUNK_DAYS = 7
+MAX_WORKERS = 8
+# "history": raw state dari /api/history/period; "statistics": perubahan per jam dari long-term
+# statistics HA (recorder/statistics_during_period), jauh lebih kecil untuk range berbulan-bulan
+SOURCES = ("history", "statistics")
+CHART_HEIGHT = 420
+
+
+@dataclass(frozen=True)
+class ExportJob:
+    """Satu unit kerja: satu site untuk beberapa hari berurutan"""
+    site: Site
+    config: dict
+    first_day: datetime.date
+    last_day: datetime.date
+    source: str = "history"
+
+
+def _site_levels(raw_data, start_datetime, end_datetime):
+    """Level counter per jam, dilengkapi sampai batas akhir range supaya jam terakhir ikut terhitung"""
+    levels = plot_data.hourly_levels(raw_data, start_datetime, end_datetime) if raw_data else None
+    if levels is None or levels.empty:
+        return None
+    end = pd.Timestamp(end_datetime).tz_convert(levels.index.tz).floor("h")
+    full_range = pd.date_range(levels.index[0], end, freq="h")
+    return EnergySeries.from_frame(levels[["value"]].reindex(full_range, method="ffill"), np.float64)
+
+
+def _statistics_levels(rows, start_datetime, end_datetime):
+    """Level counter per jam dari perubahan per jam long-term statistics (kumulatif sejak awal range)"""
+    changes = plot_data.process_statistics(rows)
+    if changes is None or changes.empty:
+        return None
+    tz = changes.index.tz
+    end = pd.Timestamp(end_datetime).tz_convert(tz).floor("h")
+    full_range = pd.date_range(pd.Timestamp(start_datetime).tz_convert(tz), end, freq="h")
+    # Level di awal jam = jumlah perubahan semua jam sebelumnya
+    hourly = changes["value"].reindex(full_range[:-1], fill_value=0.0).to_numpy()
+    levels = pd.DataFrame({"value": np.concatenate([[0.0], np.cumsum(hourly)])}, index=full_range)
+    return EnergySeries.from_frame(levels, np.float64)
+
+
+def run_job(job):
+    """Fetch dan hitung energy balance hourly satu site untuk range hari di job (jalan di worker)
+
+    Raise kalau histori gagal diambil, supaya job gagal tidak tertukar dengan site yang memang tanpa data.
+    """
+    ha_api = HomeAssistantAPI(job.site.name, config=job.config)
+    start_datetime = datetime.datetime.combine(job.first_day, datetime.time(0, 0), tzinfo=LOCAL_TZ)
+    # Energi jam terakhir baru terlihat di level jam 00:00 hari berikutnya
+    end_datetime = min(
+        datetime.datetime.combine(job.last_day + datetime.timedelta(days=1), datetime.time(0, 0), tzinfo=LOCAL_TZ),
+        datetime.datetime.now(LOCAL_TZ),
+    )
+    entities = {role: entity_id for role, entity_id in job.site.entities.items() if entity_id}
+
+    if job.source == "statistics":
+        rows = ha_api.get_statistics(start_datetime, end_datetime, list(dict.fromkeys(entities.values())), period="hour")
+        if rows is None:
+            raise RuntimeError(f"statistics {job.first_day} s/d {job.last_day} gagal diambil")
+        return energy_balance({
+            role: _statistics_levels(rows.get(entity_id), start_datetime, end_datetime)
+            for role, entity_id in entities.items()
+        })
+
+    data = ha_api.get_pv_statistics_bulk(start_datetime, end_datetime, list(entities.values()))
+    if data is None:
+        raise RuntimeError(f"histori {job.first_day} s/d {job.last_day} gagal diambil")
+    return energy_balance({
+        role: _site_levels(data.get(entity_id), start_datetime, end_datetime)
+        for role, entity_id in entities.items()
+    })
+
+
+def plan_jobs(sites, secrets, first_day, last_day, chunk_days=CHUNK_DAYS, source="history"):
+    """Pecah range per site menjadi job beberapa hari"""
+    jobs = []
+    for site in sites:
+        day = first_day
+        while day <= last_day:
+            chunk_end = min(day + datetime.timedelta(days=chunk_days - 1), last_day)
+            jobs.append(ExportJob(site, dict(secrets[site.secrets_key]), day, chunk_end, source))
+            day = chunk_end + datetime.timedelta(days=1)
+    return jobs
+
+
+def _concat_chunks(chunks):
+    """Gabungkan EnergySeries hourly per chunk; kolom yang tidak ada di sebagian chunk (sensor baru / mati) dianggap 0"""
+    columns = [name for name in BALANCE_COLUMNS if any(name in chunk.columns for chunk in chunks)]
+    chunks = sorted(chunks, key=lambda chunk: chunk.hours[0])
+    if all(chunk.columns == tuple(columns) for chunk in chunks):
+        return EnergySeries.concat(chunks)
+    return EnergySeries.from_frame(
+        pd.concat([chunk.to_frame(aware=True) for chunk in chunks]).reindex(columns=columns).fillna(0.0)
+    )
+
+
+def write_table(series, path, formats):
+    """Simpan EnergySeries sebagai Parquet dan/atau CSV dengan timestamp waktu lokal"""
+    table = series.to_frame(aware=True).reset_index()
+    for table_format in formats:
+        if table_format == "parquet":
+            table.to_parquet(f"{path}.parquet", index=False)
+        else:
+            table.to_csv(f"{path}.csv", index=False, float_format="%.3f")
+
+
+def write_charts(name, balance, granularity, path):
+    """Grafik produksi PV dan penggunaan energi satu site sebagai satu file HTML statis"""
+    def column(series_name):
+        return balance[series_name].to_frame("value") if series_name in balance.columns else None
+
+    figures = []
+    if "solar" in balance.columns:
+        figures.append(("PV Production", plot_data.build_figure(plot_data.solar_production_traces(column("solar")), granularity)))
+    if "consumed_solar" in balance.columns and "grid_import" in balance.columns:
+        traces = plot_data.energy_usage_traces(
+            column("consumed_solar"), column("grid_import"), column("grid_export"),
+            column("battery_discharge"), column("battery_charge"),
+        )
+        figures.append(("Energy Usage", plot_data.build_figure(traces, granularity, barmode="relative", range_traces=2)))
+
+    sections = []
+    for index, (title, figure) in enumerate(figures):
+        # Figure dari cache tidak diubah, tinggi diganti di salinan layout
+        figure = {**figure, "layout": {**figure["layout"], "height": CHART_HEIGHT}}
+        sections.append(f"<h2>{name} {title}</h2>")
+        sections.append(pio.to_html(figure, include_plotlyjs="cdn" if index == 0 else False, full_html=False))
+    with open(path, "w", encoding="utf-8") as html_file:
+        html_file.write(
+            "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+            f"<title>Recap {name}</title></head>"
+            "<body style='background:#1a1a2e;color:#fff;font-family:sans-serif'>"
+            + "".join(sections)
+            + "</body></html>"
+        )
+
+
+def export(sites, secrets, first_day, last_day, output_dir=OUTPUT_DIR, formats=("parquet",),
+           charts=True, executor="process", max_workers=MAX_WORKERS, chunk_days=CHUNK_DAYS, source="history"):
+    """Jalankan semua job paralel lalu tulis tabel hourly/daily dan grafik per site
+
+    Return (daily balance per site, job yang gagal). Kalau ada job gagal, hari-harinya dicatat di
+    `incomplete_days.csv` dan fleet summary tidak ditulis karena angkanya tidak lengkap.
+    """
+    jobs = plan_jobs(sites, secrets, first_day, last_day, chunk_days, source)
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    site_chunks = {}
+    failed_jobs = []
+    with pool_class(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_job, job) for job in jobs]
+        for job, future in zip(jobs, futures):
+            try:
+                balance = future.result()
+            except Exception as e:
+                logger.error("%s: job %s s/d %s gagal: %s", job.site.name, job.first_day, job.last_day, e)
+                failed_jobs.append((job, str(e)))
+                continue
+            if balance is not None:
+                site_chunks.setdefault(job.site.name, []).append(balance)
+
+    start_datetime = datetime.datetime.combine(first_day, datetime.time(0, 0), tzinfo=LOCAL_TZ)
+    end_datetime = datetime.datetime.combine(last_day, datetime.time(23, 59), tzinfo=LOCAL_TZ)
+    granularity = select_granularity(start_datetime, end_datetime)
+
+    os.makedirs(output_dir, exist_ok=True)
+    daily_balances = {}
+    for site in sites:
+        chunks = site_chunks.get(site.name)
+        if not chunks:
+            logger.warning("%s: tidak ada data untuk %s s/d %s", site.name, first_day, last_day)
+            continue
+        hourly = _concat_chunks(chunks)
+        rollups = build_rollups(hourly)
+        daily_balances[site.name] = rollups["day"]
+
+        site_dir = os.path.join(output_dir, site.name)
+        os.makedirs(site_dir, exist_ok=True)
+        write_table(hourly, os.path.join(site_dir, "hourly"), formats)
+        write_table(rollups["day"], os.path.join(site_dir, "daily"), formats)
+        if charts:
+            write_charts(site.name, rollups[granularity].to_frame(), granularity, os.path.join(site_dir, "recap.html"))
+
+    # Sisa run sebelumnya dibuang supaya isi output selalu sesuai run ini
+    for name in (INCOMPLETE_FILE, FLEET_SUMMARY_FILE):
+        if os.path.exists(os.path.join(output_dir, name)):
+            os.remove(os.path.join(output_dir, name))
+
+    if failed_jobs:
+        pd.DataFrame(
+            [(job.site.name, job.first_day, job.last_day, error) for job, error in failed_jobs],
+            columns=["site", "first_day", "last_day", "error"],
+        ).to_csv(os.path.join(output_dir, INCOMPLETE_FILE), index=False)
+        logger.warning("%d job gagal, fleet summary tidak ditulis (lihat %s)", len(failed_jobs), INCOMPLETE_FILE)
+    elif daily_balances:
+        summary = FleetView.build(daily_balances).summary()
+        summary.to_csv(os.path.join(output_dir, FLEET_SUMMARY_FILE), index=False, float_format="%.3f")
+    return daily_balances, failed_jobs
+
+
+def main():
+    yesterday = datetime.datetime.now(LOCAL_TZ).date() - datetime.timedelta(days=1)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=yesterday, help="tanggal awal (YYYY-MM-DD)")
+    parser.add_argument("--end", type=datetime.date.fromisoformat, help="tanggal akhir, default sama dengan --start")
+    parser.add_argument("--sites", nargs="+", help="nama site, default semua site")
+    parser.add_argument("--group", help="hanya site di group ini")
+    parser.add_argument("--config", default=SITES_CONFIG)
+    parser.add_argument("--secrets", default=SECRETS_PATH, help="file TOML berisi url/token per site")
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    parser.add_argument("--format", nargs="+", choices=["parquet", "csv"], default=["parquet"])
+    parser.add_argument("--no-charts", action="store_true")
+    parser.add_argument("--executor", choices=["process", "thread"], default="process")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--chunk-days", type=int, default=CHUNK_DAYS)
+    parser.add_argument("--source", choices=SOURCES, default="history", help="sumber data energi")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    registry = SiteRegistry.load(args.config)
+    with open(args.secrets, "rb") as secrets_file:
+        secrets = tomllib.load(secrets_file)
+    names = args.sites or registry.names(args.group)
+    sites = [registry.get(name) for name in names]
+
+    started = time.perf_counter()
+    balances, failed_jobs = export(
+        sites, secrets, args.start, args.end or args.start,
+        output_dir=args.output,
+        formats=args.format,
+        charts=not args.no_charts,
+        executor=args.executor,
+        max_workers=args.workers,
+        chunk_days=args.chunk_days,
+        source=args.source,
+    )
+    logger.info("%d/%d site diexport ke %s dalam %.1f detik", len(balances), len(sites), args.output, time.perf_counter() - started)
+    if failed_jobs:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
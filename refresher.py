@@ -0,0 +1,94 @@
+import datetime
+import logging
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from energy_series import LOCAL_TZ
+
+logger = logging.getLogger(__name__)
+
+# Default jeda antar refresh per site (detik) dan jitter acak +/- supaya tidak serentak
+REFRESH_INTERVAL = 45
+REFRESH_JITTER = 10
+# Thread untuk refresh site basi yang dipicu dashboard
+BACKGROUND_WORKERS = 4
+
+
+class TodayRefresher:
+    """Worker background yang terus menarik state baru hari ini untuk semua site ke DayCache"""
+
+    def __init__(self, sites, ha_apis, day_cache, interval=REFRESH_INTERVAL, jitter=REFRESH_JITTER):
+        self.sites = sites
+        self.ha_apis = ha_apis
+        self.day_cache = day_cache
+        self.interval = interval
+        self.jitter = jitter
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for site in self.sites:
+            thread = threading.Thread(
+                target=self._run_site, args=(site,), name=f"refresh-{site.name}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+
+    def _delay(self, site):
+        interval = site.refresh_interval or self.interval
+        jitter = self.jitter if site.refresh_jitter is None else site.refresh_jitter
+        return max(1.0, interval + random.uniform(-jitter, jitter))
+
+    def _run_site(self, site):
+        # Jeda pertama juga pakai jitter supaya semua site tidak mulai bersamaan
+        while not self.stop_event.wait(self._delay(site)):
+            try:
+                self.refresh_site(site)
+            except Exception as e:
+                logger.warning("Refresh %s gagal: %s", site.name, e)
+
+    def refresh_site(self, site):
+        refresh_today(site, self.ha_apis[site.name], self.day_cache)
+
+
+class BackgroundRefresh:
+    """Refresh data hari ini per site di background tanpa menahan render; satu refresh berjalan per site"""
+
+    def __init__(self, day_cache, max_workers=BACKGROUND_WORKERS):
+        self.day_cache = day_cache
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stale-refresh")
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def submit(self, site, ha_api):
+        with self.lock:
+            future = self.pending.get(site.name)
+            if future is None or future.done():
+                future = self.pending[site.name] = self.pool.submit(refresh_today, site, ha_api, self.day_cache)
+        return future
+
+
+def refresh_today(site, ha_api, day_cache):
+    """Ambil hanya state setelah timestamp terakhir yang sudah ada di cache, lalu merge; raise kalau fetch gagal"""
+    now = datetime.datetime.now(LOCAL_TZ)
+    today = now.date()
+    day_start = datetime.datetime.combine(today, datetime.time(0, 0), tzinfo=LOCAL_TZ)
+    entity_ids = [entity_id for entity_id in dict.fromkeys(site.entities.values()) if entity_id]
+
+    last_seen = [day_cache.last_timestamp(site.name, entity_id, today) for entity_id in entity_ids]
+    # Entity yang belum punya slice hari ini diambil dari jam 00:00
+    start = day_start if None in last_seen else min(last_seen)
+
+    data = ha_api.get_pv_statistics_bulk(start, now, entity_ids)
+    if data is None:
+        raise RuntimeError(f"state {site.name} sejak {start.isoformat()} gagal diambil")
+    for entity_id, series in data.items():
+        if series:
+            day_cache.merge_day(site.name, entity_id, today, LOCAL_TZ, series[0])
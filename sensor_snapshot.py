@@ -0,0 +1,141 @@
+import fnmatch
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# Default domain entity yang ditampilkan di grid sensor
+SENSOR_DOMAINS = ("sensor",)
+
+
+class EntityFilter:
+    """Filter entity_id berdasarkan domain dan/atau pola glob (misal "sensor.*_power")"""
+
+    def __init__(self, domains=SENSOR_DOMAINS, patterns=()):
+        self.domains = frozenset(domains or ())
+        # Semua pola digabung jadi satu regex supaya tiap entity cukup dicek sekali
+        self.pattern = re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns)) if patterns else None
+
+    def matches(self, entity_id):
+        if self.domains and entity_id.partition(".")[0] not in self.domains:
+            return False
+        return self.pattern is None or self.pattern.match(entity_id) is not None
+
+
+@dataclass(frozen=True)
+class SensorState:
+    """State satu entity yang ditampilkan di card"""
+    state: str
+    unit: str = ""
+
+
+@dataclass(frozen=True)
+class SnapshotDiff:
+    """Perubahan entity antara dua poll"""
+    added: frozenset = frozenset()
+    changed: frozenset = frozenset()
+    removed: frozenset = frozenset()
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+
+class SensorSnapshot:
+    """State entity terfilter dari satu poll /api/states, diindex per entity_id (urut)"""
+
+    def __init__(self, states):
+        self.states = dict(sorted(states.items()))
+        # HTML card per entity dan grid-nya, dibangun sekali per snapshot (lihat DashboardUI.render_sensors)
+        self.cards = {}
+        self.html = None
+
+    @classmethod
+    def from_states(cls, raw_states, entity_filter):
+        """Dari response /api/states; attributes lain dibuang, hanya state dan satuan yang disimpan"""
+        return cls({
+            entry["entity_id"]: SensorState(
+                str(entry.get("state")),
+                (entry.get("attributes") or {}).get("unit_of_measurement", ""),
+            )
+            for entry in raw_states or []
+            if entity_filter.matches(entry.get("entity_id", ""))
+        })
+
+    def __len__(self):
+        return len(self.states)
+
+    def __iter__(self):
+        return iter(self.states.items())
+
+    def diff(self, previous):
+        """Entity yang baru muncul, berubah state/satuannya, atau hilang dibanding snapshot sebelumnya"""
+        current, old = self.states, previous.states
+        return SnapshotDiff(
+            added=frozenset(current.keys() - old.keys()),
+            changed=frozenset(entity_id for entity_id in current.keys() & old.keys() if current[entity_id] != old[entity_id]),
+            removed=frozenset(old.keys() - current.keys()),
+        )
+
+    def carry_cards(self, previous, diff):
+        """Pakai lagi card HTML entity yang tidak berubah dari snapshot sebelumnya; hanya added | changed
+        yang nanti dibangun ulang, card entity yang removed ikut terbuang"""
+        rebuild = diff.added | diff.changed
+        self.cards.update(
+            (entity_id, card) for entity_id, card in list(previous.cards.items())
+            if entity_id in self.states and entity_id not in rebuild
+        )
+
+
+class SensorPoller:
+    """Poll /api/states satu site dan simpan snapshot terakhir.
+
+    Kalau tidak ada yang berubah, snapshot lama (beserta HTML grid-nya) dipakai lagi sehingga
+    render berikutnya tidak membangun apa pun.
+    """
+
+    def __init__(self, ha_api, entity_filter):
+        self.ha_api = ha_api
+        self.entity_filter = entity_filter
+        self.snapshot = SensorSnapshot({})
+        self.lock = threading.Lock()
+        # Satu poll berjalan per site; render hanya menunggu sampai deadline
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sensors-{ha_api.instance}")
+        self.pending = None
+
+    def refresh(self, timeout):
+        """Poll di background dan tunggu paling lama `timeout` detik; return snapshot terbaru
+
+        Selama circuit breaker site tidak sehat tidak ada poll sama sekali. Poll yang lewat deadline
+        tetap jalan dan hasilnya dipakai render berikutnya; sementara itu snapshot terakhir yang tampil.
+        """
+        if not self.ha_api.breaker.healthy:
+            return self.snapshot
+        with self.lock:
+            if self.pending is None or self.pending.done():
+                self.pending = self.pool.submit(self.poll)
+            future = self.pending
+        try:
+            return future.result(timeout=timeout)[0]
+        except TimeoutError:
+            return self.snapshot
+
+    def poll(self):
+        """Ambil state terbaru; return (snapshot, diff). Kalau gagal, snapshot terakhir dipakai"""
+        try:
+            raw_states = self.ha_api.get_data()
+        except Exception as e:
+            logger.warning("Poll sensor %s gagal: %s", self.ha_api.instance, e)
+            raw_states = None
+
+        with self.lock:
+            if raw_states is None:
+                return self.snapshot, SnapshotDiff()
+            snapshot = SensorSnapshot.from_states(raw_states, self.entity_filter)
+            diff = snapshot.diff(self.snapshot)
+            if diff:
+                snapshot.carry_cards(self.snapshot, diff)
+                self.snapshot = snapshot
+            return self.snapshot, diff
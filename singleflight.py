@@ -0,0 +1,29 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Gabungkan panggilan identik yang sedang berjalan: pemanggil lain menunggu hasil yang sama"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+
+        if not leader:
+            return call.result()
+
+        try:
+            call.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            call.set_exception(e)
+        finally:
+            with self.lock:
+                del self.calls[key]
+        return call.result()
@@ -0,0 +1,64 @@
+import tomllib
+from dataclasses import dataclass, field
+
+SITES_CONFIG = "sites.toml"
+
+# Role entity energi yang dikenal dashboard
+ROLES = ("import_plts", "import_pln", "export_pln", "energy_from_battery", "energy_to_battery")
+
+
+@dataclass(frozen=True)
+class Site:
+    """Satu site HA beserta mapping entity per role"""
+    name: str
+    group: str = ""
+    secrets_key: str = ""
+    entities: dict = field(default_factory=dict, hash=False, compare=False)
+    # Jeda dan jitter refresh background (detik), None = pakai default refresher
+    refresh_interval: float = None
+    refresh_jitter: float = None
+    # Batas waktu tunggu fetch site ini per render (detik), None = pakai default [fetch]
+    deadline: float = None
+
+
+class SiteRegistry:
+    """Daftar site dari file config, dibaca sekali per proses"""
+
+    def __init__(self, sites, refresher=None, stream=None, fetch=None, sensors=None):
+        self.sites = {site.name: site for site in sites}
+        self.refresher = refresher or {}
+        self.stream = stream or {}
+        self.fetch = fetch or {}
+        self.sensors = sensors or {}
+
+    @classmethod
+    def load(cls, path=SITES_CONFIG):
+        with open(path, "rb") as config_file:
+            config = tomllib.load(config_file)
+
+        default_entities = config.get("defaults", {}).get("entities", {})
+        sites = []
+        for site_config in config.get("sites", []):
+            entities = {role: None for role in ROLES}
+            entities.update(default_entities)
+            entities.update(site_config.get("entities", {}))
+            sites.append(Site(
+                name=site_config["name"],
+                group=site_config.get("group", ""),
+                secrets_key=site_config.get("secrets_key", site_config["name"]),
+                entities=entities,
+                refresh_interval=site_config.get("refresh_interval"),
+                refresh_jitter=site_config.get("refresh_jitter"),
+                deadline=site_config.get("deadline"),
+            ))
+        return cls(sites, config.get("refresher"), config.get("stream"), config.get("fetch"), config.get("sensors"))
+
+    def get(self, name):
+        return self.sites[name]
+
+    def names(self, group=None):
+        """Nama site (urut sesuai config), opsional hanya untuk satu group"""
+        return [site.name for site in self.sites.values() if group is None or site.group == group]
+
+    def groups(self):
+        return list(dict.fromkeys(site.group for site in self.sites.values() if site.group))
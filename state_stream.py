@@ -0,0 +1,168 @@
+import datetime
+import json
+import logging
+import threading
+from collections import deque
+
+from energy_series import LOCAL_TZ
+
+logger = logging.getLogger(__name__)
+
+# Jumlah state terakhir yang disimpan per entity
+BUFFER_SIZE = 2048
+# Jeda reconnect awal dan maksimum (detik), naik dua kali lipat tiap gagal
+RECONNECT_DELAY = 5
+MAX_RECONNECT_DELAY = 120
+
+SUBSCRIPTION_ID = 1
+
+
+def _timestamp(value):
+    """Timestamp epoch (detik) dari format state terkompresi HA ke datetime UTC"""
+    return datetime.datetime.fromtimestamp(value, datetime.timezone.utc)
+
+
+class StateStream:
+    """Langganan perubahan state entity energi satu site lewat websocket HA.
+
+    State terbaru tiap entity disimpan di ring buffer (format sama dengan baris histori),
+    lalu digabung ke slice hari ini di DayCache tanpa polling histori. Setelah reconnect,
+    celah selama terputus diisi dari /api/history/period.
+    """
+
+    def __init__(self, site, ha_api, buffer_size=BUFFER_SIZE, reconnect_delay=RECONNECT_DELAY):
+        self.site = site
+        self.ha_api = ha_api
+        self.reconnect_delay = reconnect_delay
+        self.entity_ids = [entity_id for entity_id in dict.fromkeys(site.entities.values()) if entity_id]
+        self.buffers = {entity_id: deque(maxlen=buffer_size) for entity_id in self.entity_ids}
+        self.last_seen = {}
+        self.lock = threading.Lock()
+        self.connected = threading.Event()
+        self.stop_event = threading.Event()
+        self.ws = None
+        self.thread = threading.Thread(target=self._run, name=f"stream-{site.name}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        ws = self.ws
+        if ws is not None:
+            ws.close()
+        self.thread.join()
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self.stop_event.is_set():
+            try:
+                with self.ha_api.open_websocket() as ws:
+                    self.ws = ws
+                    self._subscribe(ws)
+                    # Event yang masuk selama reconcile tertahan di socket dan diproses setelahnya;
+                    # reconcile gagal = tetap dianggap terputus (merge_into False) dan reconnect lagi
+                    self.reconcile()
+                    self.connected.set()
+                    delay = self.reconnect_delay
+                    for raw in ws:
+                        message = json.loads(raw)
+                        if message.get("type") == "event" and message.get("id") == SUBSCRIPTION_ID:
+                            self._apply(message["event"])
+            except Exception as e:
+                if not self.stop_event.is_set():
+                    logger.warning("Stream %s terputus: %s", self.site.name, e)
+            finally:
+                self.ws = None
+                self.connected.clear()
+            if self.stop_event.wait(delay):
+                break
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _subscribe(self, ws):
+        """Langganan state entity energi site ini saja (push state_changed yang sudah difilter HA)"""
+        _, read_timeout = self.ha_api.timeout
+        ws.send(json.dumps({"id": SUBSCRIPTION_ID, "type": "subscribe_entities", "entity_ids": self.entity_ids}))
+        while True:
+            message = json.loads(ws.recv(timeout=read_timeout))
+            if message.get("id") != SUBSCRIPTION_ID:
+                continue
+            if message.get("type") == "event":
+                self._apply(message["event"])
+                continue
+            if not message.get("success"):
+                error = message.get("error", {})
+                raise RuntimeError(f"{error.get('code')}: {error.get('message')}")
+            return
+
+    def _apply(self, event):
+        """Event subscribe_entities: "a" = snapshot state, "c" = perubahan ("+" berisi nilai baru)"""
+        for entity_id, state in event.get("a", {}).items():
+            self._append(entity_id, state.get("s"), state.get("lc", state.get("lu")))
+        for entity_id, change in event.get("c", {}).items():
+            new_state = change.get("+", {})
+            # Perubahan yang hanya menyentuh attributes tidak mengubah counter
+            if "s" in new_state:
+                self._append(entity_id, new_state["s"], new_state.get("lc", new_state.get("lu")))
+
+    def _append(self, entity_id, state, timestamp):
+        if entity_id not in self.buffers or state is None or timestamp is None:
+            return
+        moment = _timestamp(timestamp) if isinstance(timestamp, (int, float)) else datetime.datetime.fromisoformat(timestamp)
+        with self.lock:
+            last = self.last_seen.get(entity_id)
+            if last is not None and moment <= last:
+                return
+            iso_moment = moment.isoformat()
+            self.buffers[entity_id].append(
+                (moment, {"state": state, "last_changed": iso_moment, "last_updated": iso_moment})
+            )
+            self.last_seen[entity_id] = moment
+
+    def reconcile(self):
+        """Isi celah sejak state terakhir di buffer (misal saat koneksi terputus) dari histori
+
+        Raise kalau histori gagal diambil, supaya celahnya tidak dianggap sudah terisi.
+        """
+        with self.lock:
+            if len(self.last_seen) < len(self.entity_ids):
+                # Koneksi pertama: histori sebelumnya diambil dashboard sendiri lewat DayCache
+                return
+            start = min(self.last_seen.values())
+
+        data = self.ha_api.get_pv_statistics_bulk(start, datetime.datetime.now(LOCAL_TZ), self.entity_ids)
+        if data is None:
+            raise RuntimeError(f"histori sejak {start.isoformat()} gagal diambil")
+        for entity_id, series in data.items():
+            for entry in (series[0] if series else []):
+                self._append(entity_id, entry.get("state"), entry.get("last_updated") or entry.get("last_changed"))
+
+    def merge_into(self, day_cache):
+        """Gabungkan state baru dari buffer ke slice hari ini; False kalau perlu fallback ke polling"""
+        if not self.connected.is_set():
+            return False
+        today = datetime.datetime.now(LOCAL_TZ).date()
+        # Buffer hanya berisi state terbaru, jadi slice hari ini harus sudah ada di cache
+        cached_until = {
+            entity_id: day_cache.last_timestamp(self.site.name, entity_id, today) for entity_id in self.entity_ids
+        }
+        if None in cached_until.values():
+            return False
+
+        with self.lock:
+            # Buffer penuh yang dimulai setelah data cache berarti ada state yang sudah terbuang
+            if any(
+                len(buffer) == buffer.maxlen and buffer[0][0] > cached_until[entity_id]
+                for entity_id, buffer in self.buffers.items()
+            ):
+                return False
+            new_entries = {
+                entity_id: [entry for moment, entry in buffer if moment > cached_until[entity_id]]
+                for entity_id, buffer in self.buffers.items()
+            }
+        # Juga entity tanpa state baru (counter diam): merge kosong memperpanjang TTL slice hari ini,
+        # kalau tidak slice-nya kedaluwarsa dan hilang dari energy balance
+        for entity_id, entries in new_entries.items():
+            day_cache.merge_day(self.site.name, entity_id, today, LOCAL_TZ, entries)
+        return True
@@ -1,8 +1,10 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import streamlit as st
 import datetime
+import functools
+import html
+from metrics import metrics
+import notify
+import plot_data
 
 # Function to load global CSS styling
 def load_css():
@@ -93,6 +95,13 @@ def load_css():
             -webkit-text-fill-color: transparent;
         }
 
+        /* Grid sensor: semua card dalam satu blok HTML */
+        .sensor-grid {
+            display: grid;
+            grid-template-columns: repeat(3, minmax(0, 1fr));
+            gap: 0 10px;
+        }
+
         /* Fix untuk container Streamlit */
         [data-testid="column"] {
             padding: 0 5px !important;
@@ -127,49 +136,55 @@ def load_css():
     </style>
     """
 
+# Emoji per kata kunci nama sensor (kata kunci pertama yang cocok yang dipakai)
+SENSOR_EMOJIS = {
+    "power": "⚡", "energy": "⚡", "battery": "🔋",
+    "temperature": "🌡️", "humidity": "💧", "co2": "🌬️",
+    "motion": "👤", "light": "💡", "network": "🌐",
+    "cost": "💰"
+}
+# Jumlah nama / nilai sensor yang emoji dan class warnanya diingat
+CARD_CACHE_SIZE = 4096
+
 class SensorCard:
     """Class untuk menampilkan sensor dalam bentuk card"""
 
     @staticmethod
+    @functools.lru_cache(maxsize=CARD_CACHE_SIZE)
     def get_sensor_emoji(sensor_name):
         """Fungsi untuk menentukan emoji berdasarkan jenis sensor"""
         sensor_name = sensor_name.lower()
-        emoji_map = {
-            "power": "⚡", "energy": "⚡", "battery": "🔋", 
-            "temperature": "🌡️", "humidity": "💧", "co2": "🌬️",
-            "motion": "👤", "light": "💡", "network": "🌐", 
-            "cost": "💰"
-        }
-        return next((emoji for key, emoji in emoji_map.items() if key in sensor_name), "📊")
+        return next((emoji for key, emoji in SENSOR_EMOJIS.items() if key in sensor_name), "📊")
 
     @staticmethod
-    def render(sensor_name, sensor_value):
-        """Fungsi untuk merender card sensor di Streamlit"""
-        emoji = SensorCard.get_sensor_emoji(sensor_name)
-        metric_class = "metric"
-
+    @functools.lru_cache(maxsize=CARD_CACHE_SIZE)
+    def get_metric_class(sensor_value):
+        """Class warna nilai: merah >= 70, oranye >= 30"""
         try:
             value_float = float(sensor_value)
-            if value_float >= 70:
-                metric_class = "metric danger"
-            elif value_float >= 30:
-                metric_class = "metric warning"
         except ValueError:
-            pass
+            return "metric"
+        if value_float >= 70:
+            return "metric danger"
+        if value_float >= 30:
+            return "metric warning"
+        return "metric"
 
-        st.markdown(
-            f"""
-            <div class="card">
-                <div class="sensor-label">
-                    <span class="emoji">{emoji}</span>
-                    {sensor_name}
-                </div>
-                <p class="{metric_class}">{sensor_value}</p>
-            </div>
-            """,
-            unsafe_allow_html=True
+    @staticmethod
+    def card_html(sensor_name, sensor_value, unit=""):
+        """HTML satu card"""
+        value = f"{sensor_value} {unit}" if unit else sensor_value
+        return (
+            '<div class="card"><div class="sensor-label">'
+            f'<span class="emoji">{SensorCard.get_sensor_emoji(sensor_name)}</span> {html.escape(sensor_name)}'
+            f'</div><p class="{SensorCard.get_metric_class(sensor_value)}">{html.escape(value)}</p></div>'
         )
 
+    @staticmethod
+    def render(sensor_name, sensor_value):
+        """Fungsi untuk merender card sensor di Streamlit"""
+        st.markdown(SensorCard.card_html(sensor_name, sensor_value), unsafe_allow_html=True)
+
 class DashboardUI:
     """Class untuk menghandle UI utama di Streamlit"""
 
@@ -185,21 +200,98 @@ class DashboardUI:
             unsafe_allow_html=True
         )
 
-    def render_sidebar(self):
-        """Render sidebar buat pilih instance"""
+    def render_sidebar(self, registry):
+        """Render sidebar buat pilih group dan instance yang ditampilkan"""
         with st.sidebar:
             st.title("🏠 Home Assistant")
-            return st.selectbox("Instance", options=["Eddie02", "EddieMawar7", "EddieHajiNawi", "EddieMawar8"], key="ha_instance")
-
-    def render_sensors(self, sensors):
-        """Render tampilan sensor dalam bentuk grid 3 kolom"""
-        if sensors:
-            cols = st.columns(3)
-            for i, sensor in enumerate(sensors):
-                with cols[i % 3]:
-                    SensorCard.render(sensor["entity_id"], sensor["state"])
+            groups = registry.groups()
+            group = st.selectbox("Group", options=["Semua"] + groups, key="ha_group") if groups else "Semua"
+            names = registry.names(None if group == "Semua" else group)
+            return st.multiselect("Instance", options=names, default=names[:4], key="ha_instance")
+
+    def render_live_toggle(self):
+        """Toggle mode live: kolom site yang mencakup hari ini di-refresh otomatis"""
+        with st.sidebar:
+            return st.toggle("🔴 Live", key="live_mode", help="Refresh otomatis panel hari ini per site")
+
+    @staticmethod
+    def render_stale_badge(instance, offline):
+        """Penanda kolom site yang ditampilkan dari data cache terakhir"""
+        if offline:
+            st.caption(f"🔌 **{instance} offline** — data cache terakhir, dicoba lagi otomatis")
         else:
+            st.caption(f"⏳ **{instance} lambat** — data cache terakhir, diperbarui di background")
+
+    def render_diagnostics(self, metrics):
+        """Panel diagnostics opsional di sidebar: ringkasan waktu per stage/site/entity"""
+        with st.sidebar:
+            if not st.checkbox("🩺 Diagnostics", key="show_diagnostics"):
+                return
+            summary = metrics.summary()
+            if summary.empty:
+                st.caption("Belum ada metrik.")
+                return
+            for stage, stage_summary in summary.groupby("stage", sort=False):
+                st.caption(f"{stage}: {stage_summary['count'].sum()} call, max {stage_summary['max_ms'].max()} ms")
+            st.dataframe(summary, hide_index=True, use_container_width=True)
+
+    def render_fleet(self, fleet, granularity):
+        """Ringkasan seluruh site yang dipilih: total, grafik produksi gabungan dan ranking site"""
+        if fleet.empty:
+            return
+        st.markdown("### 🌐 Fleet")
+        summary = fleet.summary()
+        totals = summary[["pv_kwh", "consumed_solar_kwh", "import_pln_kwh", "export_pln_kwh", "load_kwh"]].sum()
+        production = totals["pv_kwh"]
+
+        for col, (label, value) in zip(st.columns(6), [
+            ("PV Production", f"{production:.1f} kWh"),
+            ("Consumed Solar", f"{totals['consumed_solar_kwh']:.1f} kWh"),
+            ("Import PLN", f"{totals['import_pln_kwh']:.1f} kWh"),
+            ("Export PLN", f"{totals['export_pln_kwh']:.1f} kWh"),
+            ("Total Load", f"{totals['load_kwh']:.1f} kWh"),
+            ("Self-consumption", f"{totals['consumed_solar_kwh'] / production:.0%}" if production > 0 else "-"),
+        ]):
+            col.metric(label, value)
+
+        col_chart, col_ranking = st.columns([3, 2])
+        with col_chart:
+            fleet_production = fleet.fleet_totals()["solar"].dropna()
+            if not fleet_production.empty:
+                PlotPV.render_solar_production(fleet_production.to_frame("value"), granularity, key="fleet_pv_production")
+        with col_ranking:
+            st.dataframe(
+                summary,
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "self_consumption": st.column_config.ProgressColumn("Self-consumption", format="percent", min_value=0, max_value=1),
+                    "export_share": st.column_config.ProgressColumn("Export share", format="percent", min_value=0, max_value=1),
+                },
+            )
+
+    @staticmethod
+    def render_sensors(snapshot, key=None, site=None):
+        """Render SensorSnapshot sebagai grid 3 kolom dalam satu blok HTML
+
+        HTML grid disimpan di snapshot, jadi poll tanpa perubahan (snapshot yang sama) tidak
+        membangun apa pun. Card entity yang tidak berubah sudah dibawa dari snapshot sebelumnya
+        (SensorSnapshot.carry_cards), jadi hanya card added | changed yang dibangun.
+        """
+        if not len(snapshot):
             st.warning("⚠️ No sensors detected.")
+            return
+        if snapshot.html is None:
+            with metrics.timer("sensor_grid", site, key) as fields:
+                rebuilt = 0
+                for entity_id, sensor in snapshot:
+                    if entity_id not in snapshot.cards:
+                        snapshot.cards[entity_id] = SensorCard.card_html(entity_id, sensor.state, sensor.unit)
+                        rebuilt += 1
+                cards = "".join(snapshot.cards[entity_id] for entity_id, _ in snapshot)
+                snapshot.html = f'<div class="sensor-grid">{cards}</div>'
+                fields["rows"] = rebuilt
+        st.markdown(snapshot.html, unsafe_allow_html=True)
 
 class PlotPV:
     """Class untuk menampilkan grafik PV Energy Production"""
@@ -208,286 +300,73 @@ class PlotPV:
     def process_pv_data(raw_data, requested_start, requested_end):
         """Extract timestamp dan nilai PV energy total"""
         if not raw_data or len(raw_data) == 0:
-            st.warning("⚠️ Tidak ada data historis yang ditemukan.")
+            notify.warning("⚠️ Tidak ada data historis yang ditemukan.")
             return None
         
         try:
-            entity_data = raw_data[0]  # Ambil data sensor pertama
-            
-            # Format data sesuai dengan response yang diterima
-            data_points = []
-            for entry in entity_data:
-                timestamp = entry.get('last_updated') or entry.get('last_changed')
-                state = entry.get('state')
-                
-                if timestamp and state:
-                    try:
-                        value = float(state)
-                        ts = pd.to_datetime(timestamp).tz_convert('Asia/Jakarta')  # Convert to local timezone
-                        data_points.append({
-                            'timestamp': ts,
-                            'value': value
-                        })
-                    except (ValueError, TypeError):
-                        continue
+            df_levels = PlotPV.hourly_levels(raw_data, requested_start, requested_end)
             
-            if not data_points:
-                st.warning("⚠️ Tidak ada data valid yang dapat diproses")
+            if df_levels is None:
+                notify.warning("⚠️ Tidak ada data valid yang dapat diproses")
                 return None
             
-            # Convert ke DataFrame dan sort
-            df = pd.DataFrame(data_points)
-            df.set_index('timestamp', inplace=True)
-            df = df.sort_index()
-            
-            # Remove duplicates
-            df = df[~df.index.duplicated(keep='first')]
-            
-            # Convert requested timestamps to pandas datetime for comparison
-            req_start = pd.to_datetime(requested_start).tz_convert('Asia/Jakarta')
-            req_end = pd.to_datetime(requested_end).tz_convert('Asia/Jakarta')
-            
-            # Filter data to match requested time range
-            df_filtered = df[(df.index >= req_start) & (df.index <= req_end)]
-            
             # Calculate hourly differences
-            df_hourly = df_filtered.resample('H').ffill().diff().dropna()
+            df_hourly = df_levels.diff().dropna()
             
             return df_hourly
             
         except Exception as e:
-            st.error(f"Error saat memproses data: {str(e)}")
+            notify.error(f"Error saat memproses data: {str(e)}")
             import traceback
-            st.error(traceback.format_exc())
+            notify.error(traceback.format_exc())
             return None
 
+    # Proses data dan figure tanpa Streamlit ada di plot_data (juga dipakai recap_export)
+    hourly_levels = staticmethod(plot_data.hourly_levels)
+    process_statistics = staticmethod(plot_data.process_statistics)
+    time_axis = staticmethod(plot_data.time_axis)
+    energy_usage_traces = staticmethod(plot_data.energy_usage_traces)
+    solar_production_traces = staticmethod(plot_data.solar_production_traces)
+    build_figure = staticmethod(plot_data.build_figure)
+    downsample = staticmethod(plot_data.downsample)
+
     @staticmethod
     def render(df, entity_name="Daily Energy"):
         """Render grafik produksi PV dengan tampilan modern"""
-        try:
-            # Container untuk kontrol dan grafik
-            with st.container():
-                # Persiapkan data untuk plotting
-                chart_data = df.copy()
-                chart_data.index = chart_data.index.tz_localize(None)  # Remove timezone
-                
-                # Tentukan format tanggal berdasarkan range data
-                date_range = (chart_data.index.max() - chart_data.index.min()).days if not df.empty else 0
-                if date_range > 1:
-                    tick_format = "%d/%m %H:%M"  # Format untuk multiple days
-                    hover_format = "%d %b %Y %H:%M"  # Format lengkap untuk hover
-                else:
-                    tick_format = "%H:%M"  # Format untuk single day
-                    hover_format = "%d %b %Y %H:%M"  # Format lengkap untuk hover
-                
-                # Konfigurasi plot
-                fig = {
-                    "data": [{
-                        "x": chart_data.index,
-                        "y": chart_data["value"],
-                        "type": "bar",  # Change to bar chart
-                        "marker": {
-                            "color": "#FFD700",  # Change color to yellow
-                        },
-                        "hovertemplate": f"<b>%{{y:.2f}} kWh</b><br>%{{x|{hover_format}}}<extra></extra>",
-                    }],
-                    "layout": {
-                        "plot_bgcolor": "#1a1a2e",
-                        "paper_bgcolor": "#1a1a2e",
-                        "font": {"color": "#ffffff"},
-                        "xaxis": {
-                            "showgrid": True,
-                            "gridcolor": "#2a2a4a",
-                            "title": None,
-                            "tickformat": tick_format,
-                            "hoverformat": hover_format,
-                            "range": [
-                                chart_data.index.min().replace(hour=0, minute=0),
-                                chart_data.index.max().replace(hour=23, minute=59)
-                            ] if not df.empty else [0, 0]
-                        },
-                        "yaxis": {
-                            "showgrid": True,
-                            "gridcolor": "#2a2a4a",
-                            "title": "kWh",
-                            "tickformat": ",.0f",
-                        },
-                        "margin": {"t": 5, "l": 5, "r": 5, "b": 5},  # Further reduced margins
-                        "height": 220,  # Further reduced height
-                        "hovermode": "x unified",
-                    }
-                }
-                
-                # Render plot
-                st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
-
-        except Exception as e:
-            st.error(f"Error saat plotting data: {str(e)}")
+        PlotPV.render_figure([{
+            "df": df,
+            "color": "#FFD700",
+            "hovertemplate": "<b>%{y:.2f} kWh</b><br>%{x|{hover_format}}<extra></extra>",
+        }])
 
     @staticmethod
-    def render_energy_usage(df_consumed_solar, df_import_pln, df_export_pln, df_energy_from_battery=None, df_energy_to_battery=None):
+    def render_energy_usage(df_consumed_solar, df_import_pln, df_export_pln, df_energy_from_battery=None, df_energy_to_battery=None, granularity="hour", key=None, site=None):
         """Render grafik penggunaan energi dengan tampilan modern"""
-        try:
-            # Container untuk kontrol dan grafik
-            with st.container():
-                # Persiapkan data untuk plotting
-                chart_data = pd.DataFrame({
-                    "Consumed Solar": df_consumed_solar["value"],
-                    "Import PLN": df_import_pln["value"],
-                })
-
-                # Buat traces terpisah untuk nilai positif dan negatif
-                traces = [
-                    {
-                        "x": chart_data.index,
-                        "y": chart_data["Consumed Solar"],
-                        "type": "bar",
-                        "name": "Consumed Solar",
-                        "marker": {"color": "rgba(255, 193, 7, 0.6)"},
-                        "hovertemplate": "<b>Consumed Solar</b><br>%{y:.2f} kWh<extra></extra>",
-                    },
-                    {
-                        "x": chart_data.index,
-                        "y": chart_data["Import PLN"],
-                        "type": "bar",
-                        "name": "Import PLN",
-                        "marker": {"color": "rgba(0, 123, 255, 0.6)"},
-                        "hovertemplate": "<b>Import PLN</b><br>%{y:.2f} kWh<extra></extra>",
-                    },
-                    {
-                        "x": df_export_pln.index,
-                        "y": -df_export_pln["value"],  # Negative values for export
-                        "type": "bar",
-                        "name": "Export PLN",
-                        "marker": {"color": "rgba(123, 0, 255, 0.6)"},
-                        "hovertemplate": "<b>Export PLN</b><br>%{y:.2f} kWh<extra></extra>",
-                    }
-                ]
-
-                if df_energy_from_battery is not None and df_energy_to_battery is not None:
-                    traces.extend([
-                        {
-                            "x": df_energy_from_battery.index,
-                            "y": df_energy_from_battery["value"],
-                            "type": "bar",
-                            "name": "Energy from Battery",
-                            "marker": {"color": "rgba(0, 255, 0, 0.6)"},
-                            "hovertemplate": "<b>Energy from Battery</b><br>%{y:.2f} kWh<extra></extra>",
-                        },
-                        {
-                            "x": df_energy_to_battery.index,
-                            "y": -df_energy_to_battery["value"],  # Negative values for energy to battery
-                            "type": "bar",
-                            "name": "Energy to Battery",
-                            "marker": {"color": "rgba(255, 0, 255, 0.6)"},
-                            "hovertemplate": "<b>Energy to Battery</b><br>%{y:.2f} kWh<extra></extra>",
-                        }
-                    ])
-
-                # Tentukan format tanggal berdasarkan range data
-                date_range = (chart_data.index.max() - chart_data.index.min()).days if not chart_data.empty else 0
-                if date_range > 1:
-                    tick_format = "%d/%m %H:%M"
-                    hover_format = "%d %b %Y %H:%M"
-                else:
-                    tick_format = "%H:%M"
-                    hover_format = "%d %b %Y %H:%M"
-                
-                # Konfigurasi plot
-                fig = {
-                    "data": traces,
-                    "layout": {
-                        "barmode": "relative",  # Change to relative to allow negative values
-                        "plot_bgcolor": "#1a1a2e",
-                        "paper_bgcolor": "#1a1a2e",
-                        "font": {"color": "#ffffff"},
-                        "xaxis": {
-                            "showgrid": True,
-                            "gridcolor": "#2a2a4a",
-                            "title": None,
-                            "tickformat": tick_format,
-                            "hoverformat": hover_format,
-                            "range": [
-                                chart_data.index.min().replace(hour=0, minute=0),
-                                chart_data.index.max().replace(hour=23, minute=59)
-                            ] if not chart_data.empty else [0, 0]
-                        },
-                        "yaxis": {
-                            "showgrid": True,
-                            "gridcolor": "#2a2a4a",
-                            "title": "kWh",
-                            "tickformat": ",.0f",
-                        },
-                        "margin": {"t": 5, "l": 5, "r": 5, "b": 5},
-                        "height": 220,
-                        "hovermode": "x unified",
-                    }
-                }
-                
-                # Render plot
-                st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
-
-        except Exception as e:
-            st.error(f"Error saat plotting data: {str(e)}")
+        traces = PlotPV.energy_usage_traces(df_consumed_solar, df_import_pln, df_export_pln, df_energy_from_battery, df_energy_to_battery)
+        # Range sumbu x mengikuti Consumed Solar + Import PLN
+        PlotPV.render_figure(traces, granularity, barmode="relative", range_traces=2, key=key, site=site)
 
     @staticmethod
-    def render_solar_production(df):
+    def render_solar_production(df, granularity="hour", key=None, site=None):
         """Render grafik produksi solar dengan tampilan modern"""
+        PlotPV.render_figure(PlotPV.solar_production_traces(df), granularity, key=key, site=site)
+
+    @staticmethod
+    def render_figure(traces, granularity="hour", barmode=None, range_traces=None, key=None, site=None):
+        """Render satu grafik dari daftar trace; figure di-cache berdasarkan fingerprint data
+
+        `site` hanya untuk label metrik figure_build / figure_serialize.
+        """
         try:
             # Container untuk kontrol dan grafik
             with st.container():
-                # Persiapkan data untuk plotting
-                chart_data = df.copy()
-                chart_data.index = chart_data.index.tz_localize(None)  # Remove timezone
+                with metrics.timer("figure_build", site, key) as fields:
+                    fig = PlotPV.build_figure(traces, granularity, barmode, range_traces)
+                    fields["rows"] = sum(len(trace["y"]) for trace in fig["data"])
                 
-                # Tentukan format tanggal berdasarkan range data
-                date_range = (chart_data.index.max() - chart_data.index.min()).days if not df.empty else 0
-                if date_range > 1:
-                    tick_format = "%d/%m %H:%M"  # Format untuk multiple days
-                    hover_format = "%d %b %Y %H:%M"  # Format lengkap untuk hover
-                else:
-                    tick_format = "%H:%M"  # Format untuk single day
-                    hover_format = "%d %b %Y %H:%M"  # Format lengkap untuk hover
-                
-                # Konfigurasi plot
-                fig = {
-                    "data": [{
-                        "x": chart_data.index,
-                        "y": chart_data["value"],
-                        "type": "bar",
-                        "name": "Solar Production",
-                        "marker": {"color": "rgba(255, 193, 7, 0.6)"},
-                        "hovertemplate": "<b>Solar Production</b><br>%{y:.2f} kWh<br>%{x|"+hover_format+"}<extra></extra>",
-                    }],
-                    "layout": {
-                        "plot_bgcolor": "#1a1a2e",
-                        "paper_bgcolor": "#1a1a2e",
-                        "font": {"color": "#ffffff"},
-                        "xaxis": {
-                            "showgrid": True,
-                            "gridcolor": "#2a2a4a",
-                            "title": None,
-                            "tickformat": tick_format,
-                            "hoverformat": hover_format,
-                            "range": [
-                                chart_data.index.min().replace(hour=0, minute=0),
-                                chart_data.index.max().replace(hour=23, minute=59)
-                            ] if not df.empty else [0, 0]
-                        },
-                        "yaxis": {
-                            "showgrid": True,
-                            "gridcolor": "#2a2a4a",
-                            "title": "kWh",
-                            "tickformat": ",.0f",
-                        },
-                        "margin": {"t": 5, "l": 5, "r": 5, "b": 5},  # Further reduced margins
-                        "height": 220,  # Further reduced height
-                        "hovermode": "x unified",
-                    }
-                }
-                
-                # Render plot
-                st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+                # Render plot (termasuk serialisasi figure ke browser)
+                with metrics.timer("figure_serialize", site, key):
+                    st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False}, key=key)
 
         except Exception as e:
-            st.error(f"Error saat plotting data: {str(e)}")
\ No newline at end of file
+            st.error(f"Error saat plotting data: {str(e)}")